@@ -5,6 +5,8 @@ import matplotlib.ticker as ticker
 from cycler import cycler
 from spacepy.plot import style 
 
+import multimodtools as mmt
+
 style()
 
 # set style information
@@ -17,78 +19,49 @@ mpl.rcParams['ytick.labelsize'] = 12
 # data for graphs
 npc = [1, 2, 3, 4, 5]
 
-# 0.3 Threshold
-# PoD
-D1_all = 0.151, -0.028, -0.241, -0.418, -0.597
-D1_hi = 0.162, -0.013, -0.205, -0.373, -0.578
-D1_lo = 0.125, -0.064, -0.328, -0.523, -0.644
-
-D4_all = 0.145, -0.146, -0.371, -0.502, -0.566
-D4_hi = 0.176, -0.072, -0.299, -0.435, -0.578
-D4_lo = 0.056, -0.36, -0.581, -0.695, -0.644
-
-D7_all = 0.112, -0.212, -0.374, -0.45, -0.491
-D7_hi = 0.123, -0.158, -0.328, -0.412, -0.462
-D7_lo = 0.081, -0.373, -0.513, -0.562, -0.576
-
-D10_all = 0.093, -0.176, -0.322, -0.356, -0.405
-D10_hi = 0.088, -0.146, -0.289, -0.333, -0.39
-D10_lo = 0.111, -0.272, -0.432, -0.432, -0.453
-
-
-# -PoFD
-F2_all = -0.112, 0.033, 0.085, 0.105, 0.109
-F2_hi = -0.152, 0.028, 0.12, 0.158, 0.165
-F2_lo =  -0.095, 0.036, 0.071, 0.084, 0.086
-
-F5_all = -0.066, 0.031, 0.057, 0.061, 0.064
-F5_hi = -0.177, 0.049, 0.1, 0.109, 0.112
-F5_lo = -0.034, 0.021, 0.031, 0.033, 0.035
- 
-F8_all = -0.044, 0.026, 0.05, 0.057, 0.059
-F8_hi = -0.09, 0.033, 0.076, 0.089, 0.092
-F8_lo = 0.013, 0.021, 0.03, 0.033, 0.034
-
-F11_all = -0.042, 0.026, 0.047, 0.051, 0.054
-F11_hi = -0.083, 0.026, 0.063, 0.07, 0.073
-F11_lo = -0.01, 0.028, 0.035, 0.038, 0.04
-
-# HSS
-H3_all = 0.032, 0.008, -0.15, -0.308, -0.489
-H3_hi = 0.075, 0.008, -0.119, -0.239, -0.386
-H3_lo =  -0.04, 0.002, -0.191, -0.391, -0.546
-
-H6_all = 0.026, -0.087, -0.289, -0.443, -0.525
-H6_hi = 0.044, -0.016, -0.192, -0.327, -0.406
-H6_lo =  -0.052, -0.25, -0.484, -0.647, -0.697
-
-H9_all = 0.013, -0.161, -0.314, -0.407, -0.464
-H9_hi = -0.005, -0.115, -0.247, -0.334, -0.395
-H9_lo =  0.018, -0.294, -0.461, -0.536, -0.557
-
-H12_all = -0.006, -0.123, -0.269, -0.311, -0.384
-H12_hi = -0.044, -0.114, -0.226, -0.276, -0.353
-H12_lo =  0.047, -0.169, -0.383, -0.377, -0.411
-
-# Bias 0.3
-B13_all = 0.09, -0.064, -0.334, -0.532, -0.716
-B13_hi = 0.23, -0.024, -0.258, -0.444, -0.652
-B13_lo = -0.238, -0.157, -0.512, -0.74, -0.866
-
-# 0.7
-B14_all = 0.161, -0.221, -0.509, -0.651, -0.721
-B14_hi = 0.27, -0.132, -0.423, -0.571, -0.65
-B14_lo = -0.154, -0.469, -0.757, -0.881, -0.929
-
-# 1.1
-B15_all = 0.215, -0.311, -0.565, -0.667, -0.716
-B15_hi =  0.287, -0.227, -0.491, -0.604, -0.661
-B15_lo = -0.001, -0.56, -0.784, -0.854, -0.882
-
-# 1.5
-B16_all =  0.202, -0.325, -0.589, -0.65, -0.713
-B16_hi = 0.344, -0.226, -0.492, -0.558, -0.625
-B16_lo = -0.255, -0.638, -0.893, -0.936, -0.989
+# NPC metrics for all thresholds, member counts, and mag groups; only
+# combinations not already in the results store are computed:
+sweep = mmt.npc_results(threshes=mmt.thres_dt, n_required=npc)
+
+
+def change(metric, thresh, group):
+    '''
+    Change in *metric* for NPC relative to the deterministic forecast,
+    for each number of NPC members required.  PoFD changes are negated
+    (lower is better) and bias changes are the change in distance from 1.
+    '''
+    rows = sweep[(sweep['thresh'] == thresh) & (sweep['group'] == group)]
+    if metric == 'bias':
+        return abs(1 - rows['det_bias']) - abs(1 - rows['bias'])
+    if metric == 'pofd':
+        return rows['det_pofd'] - rows['pofd']
+    return rows[metric] - rows['det_' + metric]
+
+
+# PoD at 0.3, 0.7, 1.1, 1.5
+D1_all, D1_hi, D1_lo = [change('pod', 0.3, g) for g in ('all', 'hi', 'lo')]
+D4_all, D4_hi, D4_lo = [change('pod', 0.7, g) for g in ('all', 'hi', 'lo')]
+D7_all, D7_hi, D7_lo = [change('pod', 1.1, g) for g in ('all', 'hi', 'lo')]
+D10_all, D10_hi, D10_lo = [change('pod', 1.5, g) for g in ('all', 'hi', 'lo')]
+
+# -PoFD at 0.3, 0.7, 1.1, 1.5
+F2_all, F2_hi, F2_lo = [change('pofd', 0.3, g) for g in ('all', 'hi', 'lo')]
+F5_all, F5_hi, F5_lo = [change('pofd', 0.7, g) for g in ('all', 'hi', 'lo')]
+F8_all, F8_hi, F8_lo = [change('pofd', 1.1, g) for g in ('all', 'hi', 'lo')]
+F11_all, F11_hi, F11_lo = [change('pofd', 1.5, g)
+                           for g in ('all', 'hi', 'lo')]
+
+# HSS at 0.3, 0.7, 1.1, 1.5
+H3_all, H3_hi, H3_lo = [change('hss', 0.3, g) for g in ('all', 'hi', 'lo')]
+H6_all, H6_hi, H6_lo = [change('hss', 0.7, g) for g in ('all', 'hi', 'lo')]
+H9_all, H9_hi, H9_lo = [change('hss', 1.1, g) for g in ('all', 'hi', 'lo')]
+H12_all, H12_hi, H12_lo = [change('hss', 1.5, g) for g in ('all', 'hi', 'lo')]
+
+# Bias 0.3, 0.7, 1.1, 1.5
+B13_all, B13_hi, B13_lo = [change('bias', 0.3, g) for g in ('all', 'hi', 'lo')]
+B14_all, B14_hi, B14_lo = [change('bias', 0.7, g) for g in ('all', 'hi', 'lo')]
+B15_all, B15_hi, B15_lo = [change('bias', 1.1, g) for g in ('all', 'hi', 'lo')]
+B16_all, B16_hi, B16_lo = [change('bias', 1.5, g) for g in ('all', 'hi', 'lo')]
 
 
 #creating subplots
@@ -5,6 +5,8 @@ import matplotlib.ticker as ticker
 from cycler import cycler
 from spacepy.plot import style 
 
+import multimodtools as mmt
+
 style()
 
 # set style information
@@ -18,9 +20,12 @@ plt.tight_layout()
 
 npc = [1, 2, 3, 4, 5]
 
-D1_all = 0.151, 0.051, 0.009, 0, 0
-D1_hi = 0.161, 0.058, 0.013, 0.001, 0.001
-D1_lo =  0.125, 0.034, 0.001, -0.001, -0.001
+# Change in PoD for SWMF OR NPC(n) relative to SWMF alone at 0.3 nT/s,
+# from the results store (computed and stored on first use):
+sweep = mmt.npc_results(threshes=[0.3], n_required=npc)
+D1_all, D1_hi, D1_lo = [
+    (rows['or_pod'] - rows['det_pod'])
+    for rows in (sweep[sweep['group'] == g] for g in ('all', 'hi', 'lo'))]
 
 # set labels and titles
 plt.title('0.3nT/s Threshold', fontsize=20)
@@ -1,9 +1,15 @@
+'''
+Compare NPC at 0.3 nT/s with and without the scaled model thresholds.
+All curves use an observation threshold of 0.3 nT/s.
+'''
 import numpy as np
 import matplotlib.pyplot as plt
 import matplotlib as mpl
 import matplotlib.ticker as ticker
 from spacepy.plot import style 
 
+import multimodtools as mmt
+
 style()
 
 # set style information
@@ -14,6 +20,22 @@ mpl.rcParams['lines.linewidth'] = 2.5
 
 npc = [1, 2, 3, 4, 5]
 
+# Model thresholds scaled for best bias and HSS (from
+# analysis_scripts/analyze_modnpc.py):
+Bias = {'2_LFM-MIX': 0.151, '3_WEIGEL': 0.840, '4_OPENGGCM': 0.205,
+        '6_WEIMER': 0.057, '9_SWMF': 0.205}
+HSS = {'2_LFM-MIX': 0.138, '3_WEIGEL': 0.070, '4_OPENGGCM': 0.192,
+       '6_WEIMER': 0.057, '9_SWMF': 0.165}
+
+# NPC metrics at 0.3 nT/s for all stations with the set threshold and
+# both scaled thresholds, from the results store (computed on first use):
+kwargs = {'threshes': [0.3], 'n_required': npc, 'groups': {'all': 'all'}}
+sweeps = {'reg': mmt.npc_results(**kwargs),
+          'mod_b': mmt.npc_results(modthresh=[Bias[m] for m in mmt.modnames],
+                                   **kwargs),
+          'mod_h': mmt.npc_results(modthresh=[HSS[m] for m in mmt.modnames],
+                                   **kwargs)}
+
 # creating subplots
 # not sure this is the most effecent way to create them but it works?
 fig = plt.figure()
@@ -24,26 +46,24 @@ fig.subplots_adjust(hspace=0.15, wspace=0.15)
 
 
 # PoD
-mod_b = 0.958, 0.866, 0.703, 0.472, 0.077
-mod_h = 0.965, 0.918, 0.823, 0.671, 0.462
-reg = 0.860, 0.680, 0.485, 0.297, 0.119
+mod_b, mod_h, reg = [sweeps[x]['pod'] for x in ('mod_b', 'mod_h', 'reg')]
+det = sweeps['reg']['det_pod'][0]
 
 ax1.set_title('PoD', fontsize=16)
 
-ax1.axhline(y=0.698, color='grey', linestyle="--")
+ax1.axhline(y=det, color='grey', linestyle="--")
 
 ax1.plot(npc, reg, '-o', color='black', alpha=0.75)
 ax1.plot(npc, mod_b, '-o')
 ax1.plot(npc, mod_h, '-o')
 
 #PoFD
-mod_b = 0.355, 0.189, 0.078, 0.022, 0.0
-mod_h = 0.391, 0.210, 0.110, 0.044, 0.011
-reg = 0.221, 0.073, 0.023, 0.003, 0.001
+mod_b, mod_h, reg = [sweeps[x]['pofd'] for x in ('mod_b', 'mod_h', 'reg')]
+det = sweeps['reg']['det_pofd'][0]
 
 ax2.set_title('PoFD', fontsize=16)
 
-ax2.axhline(y=0.110, color='grey', linestyle="--", label='Deterministic')
+ax2.axhline(y=det, color='grey', linestyle="--", label='Deterministic')
 
 ax2.plot(npc, reg, '-o', color='black', alpha=0.75, label='Set Threshold')
 ax2.plot(npc, mod_b, '-o', label='Scaled Bias')
@@ -51,30 +71,28 @@ ax2.plot(npc, mod_h, '-o', label='Scaled HSS')
 
 
 #HSS
-mod_b = 0.619, 0.679, 0.610, 0.427, 0.070
-mod_h = 0.606, 0.718, 0.698, 0.588, 0.403
-reg = 0.637, 0.613, 0.471, 0.302, 0.122
+mod_b, mod_h, reg = [sweeps[x]['hss'] for x in ('mod_b', 'mod_h', 'reg')]
+det = sweeps['reg']['det_hss'][0]
 
 ax3.set_title('HSS', fontsize=16)
 ax3.set_xlabel('NPC Members Required', fontsize=14)
 ax3.xaxis.set_major_locator(ticker.MultipleLocator(1))
 
-ax3.axhline(y=0.593, color='grey', linestyle="--")
+ax3.axhline(y=det, color='grey', linestyle="--")
 
 ax3.plot(npc, reg, '-o', color='black', alpha=0.75)
 ax3.plot(npc, mod_b, '-o')
 ax3.plot(npc, mod_h, '-o')
 
 # Bias
-mod_b = 1.24, 1.021, 0.767, 0.490, 0.077
-mod_h = 1.235, 1.063, 0.817, 0.702, 0.470
-reg = 1.100, 0.759, 0.509, 0.301, 0.120
+mod_b, mod_h, reg = [sweeps[x]['bias'] for x in ('mod_b', 'mod_h', 'reg')]
+det = sweeps['reg']['det_bias'][0]
 # set labels and titles
 ax4.set_title('Bias', fontsize=16)
 ax4.set_xlabel('NPC Members Required', fontsize=14)
 ax4.xaxis.set_major_locator(ticker.MultipleLocator(1))
 
-ax4.axhline(y=0.817, color='grey', linestyle="--")
+ax4.axhline(y=det, color='grey', linestyle="--")
 
 ax4.plot(npc, reg, '-o', color='black', alpha=0.75)
 ax4.plot(npc, mod_b, '-o')
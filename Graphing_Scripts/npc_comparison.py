@@ -7,7 +7,7 @@ import numpy as np
 import matplotlib.pyplot as plt
 
 from spacepy.plot import style, applySmartTimeTicks
-from validator import BinaryEventTable
+from multimodtools import BinaryEventTable
 import multimodtools as mmt
 
 import os, sys
@@ -33,17 +33,30 @@ parser.add_argument("-n", "--n_models", type=int, default=2,
 parser.add_argument("-m", "--mag", type=str, default='YKC',
                     help='Set the magnetometer to analyze: ABK, PBQ, ' +
                     'SNK, YKC, NEW, OTT, or WNG')
+parser.add_argument("-j", "--jobs", type=int, default=1,
+                    help="Number of worker processes used to read and bin " +
+                    "data files; 0 uses all CPUs. Defaults to 1.")
+parser.add_argument("--profile", nargs='?', const='', metavar='PSTATS',
+                    help="Print a breakdown of time spent per stage " +
+                    "(reading, parsing, binning, etc.) at exit. If a file " +
+                    "name is given, also save cProfile statistics there.")
 
 # Process arguments:
 args = parser.parse_args()
+if args.profile is not None:
+    mmt.enable_profile(pstats=args.profile or None)
 
 tab_kwargs = {'event_set': args.event, 'mag_set': args.mag,
-              'thresh': args.threshold, 'verbose': False}
+              'thresh': args.threshold, 'verbose': False,
+              'jobs': args.jobs, 'keep_raw': True}
 
-# Create tables for all 5 models.
+# Create tables for all 5 models; add their metrics to the results store.
+store = mmt.ResultsStore()
+key = {'events': args.event, 'mags': args.mag, 'thresh': args.threshold}
 t = {}
 for m in mmt.models:
     t[m] = mmt.build_table(m, **tab_kwargs)
+    store.add(t[m], m, **key)
 
 # Time for convience.
 time = t['9_SWMF'].time
@@ -58,6 +71,7 @@ npc_forecast = 1.1 * args.threshold * (mod >= 2)
 npc_tab = BinaryEventTable(t['9_SWMF'].tObs, t['9_SWMF'].Obs, t['9_SWMF'].time,
                            npc_forecast, args.threshold,
                            trange=mmt.tlims[args.event], window=20*60)
+store.add(npc_tab, 'NPC', n_required=2, **key)
 
 # Plotting
 fig = plt.figure(figsize=(10, 7))
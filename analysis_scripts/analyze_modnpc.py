@@ -3,13 +3,11 @@
 '''
 Test script to work with dictionaries to use in modified_npc.py.
 Goal to create Build_tables for all models with their modthresh.
+
+The modified NPC is scored against the observations at --threshold.
 '''
 from argparse import ArgumentParser
-from datetime import datetime, timedelta
-
-import numpy as np
 
-from validator import BinaryEventTable
 import multimodtools as mmt
 
 # From explore_thresh.py modifed scaling
@@ -43,66 +41,54 @@ parser.add_argument("-m", "--mags", nargs='+', type=str,
                     "'all' for high latitude, mid-latitude, or both. " +
                     "e.g., --mags all hi low pbq, would run 'hi' and 'low' " +
                     "magnetometers and the PBQ station by itself.")
+parser.add_argument("--no-cache", action="store_true",
+                    help="Always parse the text data files instead of " +
+                    "using the binary cache in mmt.cachedir.")
+parser.add_argument("-j", "--jobs", type=int, default=1,
+                    help="Number of worker processes used to read and bin " +
+                    "data files; 0 uses all CPUs. Defaults to 1.")
+parser.add_argument("--profile", nargs='?', const='', metavar='PSTATS',
+                    help="Print a breakdown of time spent per stage " +
+                    "(reading, parsing, binning, etc.) at exit. If a file " +
+                    "name is given, also save cProfile statistics there.")
 
 # Process arguments:
 args = parser.parse_args()
+mmt.use_cache = not args.no_cache
+if args.profile is not None:
+    mmt.enable_profile(pstats=args.profile or None)
+
+# Metrics are also added to the results store for use by plotting scripts:
+store = mmt.ResultsStore()
+key = {'events': args.events, 'thresh': args.threshold}
+
+# Bin all models against the observations once, for every station in any
+# group; each group is then a selection of windows from the same cube.
+allcube = mmt.EnsembleCube(event_set=args.events,
+                           mag_set=mmt.union_mags(args.mags), jobs=args.jobs)
 
 # Loop over the key mag groupings: all, hi, lo
 for group in args.mags:
-    # Turn our script options into function arguments:
-    tab_kwargs = {'event_set': args.events, 'mag_set': group,
-                  'thresh': args.threshold, 'verbose': False}
-
-    # build tables for each model with their modthresh
-    # loop through metric dictionary to build each table with their modthresh
-    modtables = {}
-    for m in mmt.models:
-        modtables[mmt.models[m]] = mmt.build_table(m, modthresh=metric[m],
-                                                   **tab_kwargs)
-
-    # build tables without modthresh
-    tables = {}
-    for m in mmt.models:
-        tables[mmt.models[m]] = mmt.build_table(m, **tab_kwargs)
+    cube = allcube.select(mag_set=group)
 
     # Create Variables for metric comparisons
     # For deterministic, nonmodified, forecast
-    det = mmt.build_table("9_SWMF", args.events, group, args.threshold)
-    # For sizing
-    SWMF = modtables[mmt.models['9_SWMF']]
+    det = cube.table('9_SWMF', args.threshold)
 
     # Create modified NPC by counting the number of crossings in each bin
-    # across all ensemble members (i.e., models)
-    npc_size, obs_size = SWMF.obsmax.size, SWMF.Obs.size
-    mod = np.zeros(SWMF.obsmax.size)
-    for tab in modtables:
-        mod += 1*modtables[tab].bool
-    modified_npc_forecast = 1.1 * args.threshold * (mod >= 5)
+    # across all ensemble members (i.e., models), each with its modthresh
+    modthresh = [metric[m] for m in cube.members]
+    modified_npc = cube.npc_table(args.threshold, n_models=5,
+                                  modthresh=modthresh)
 
     # Create nonmodifed NPC
-    npc_size, obs_size = SWMF.obsmax.size, SWMF.Obs.size
-    mod = np.zeros(SWMF.obsmax.size)
-    for tab in tables:
-        mod += 1*tables[tab].bool
-    npc_forecast = 1.1 * args.threshold * (mod >= 5)
-
-    # Create a synthetic time series to match the number of data points.
-    # Doing this instead of relying on the original times, with multi-year
-    # long gaps, greatly speeds processing.
-    tstart = datetime(2000, 1, 1, 0, 0, 0)
-    t_npc = [tstart + timedelta(minutes=i*20 + 10) for i in range(npc_size)]
-    t_npc = np.array(t_npc)
-
-    # Build table using times/dates and observed values from all included
-    # events, stored in any of the other tables (but we'll use SWMF for ease.)
-    for m in metric:
-        modified_npc = BinaryEventTable(t_npc, SWMF.obsmax, t_npc,
-                                        modified_npc_forecast, metric[m],
-                                        window=20*60, verbose=False)  
-    # Build unmodified table
-    npc = BinaryEventTable(t_npc, SWMF.obsmax, t_npc, npc_forecast,
-                           args.threshold, window=20*60, verbose=False)
-    
+    npc = cube.npc_table(args.threshold, n_models=5)
+
+    store.add(det, '9_SWMF', mags=group, **key)
+    store.add(npc, 'NPC', mags=group, n_required=5, **key)
+    store.add(modified_npc, 'NPC', mags=group, n_required=5,
+              modthresh=modthresh, **key)
+
     # Print metric comparison.
     print('PoD')
     print('Mod_NPC:', modified_npc.calc_HR())
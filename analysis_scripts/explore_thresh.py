@@ -4,57 +4,47 @@
 Explore impacts of changing model's threshold (but not obs. threshold).
 '''
 
-import numpy as np
 import multimodtools as mmt
 import matplotlib.pyplot as plt
 
 plt.style.use('fivethirtyeight')
 
-# Create arrays of lowered thresholds.
+# Observation threshold; model thresholds are plotted down to 10% of it.
 thresh = .3
-tScaled = np.linspace(0, .9 * thresh, 21)
-threshes = thresh - tScaled
+tmin = .1 * thresh
 
-# Create an empty dictionary to store results.
+# Create an empty dictionary to store results; the optimal thresholds are
+# also added to the results store for use by plotting scripts.
 results = {}
+optimal = {}
+store = mmt.ResultsStore()
 
 # Loop over all models.
 for m in mmt.models:
 
-    # Create a set of containers for the results of changing
-    # the model thresholds.
-    heidke = np.zeros(tScaled.size)
-    bias = np.zeros(tScaled.size)
-    pod = np.zeros(tScaled.size)
-    pofd = np.zeros(tScaled.size)
-
-    # Loop over all thresholds.
-    for i, dthresh in enumerate(tScaled):
-        # Create the table for the given threshold:
-        table = mmt.build_table(m, thresh=thresh, modthresh=thresh-dthresh)
-
-        # Calculate and stash the associated metrics:
-        heidke[i] = table.calc_heidke()
-        bias[i] = table.calc_bias()
-        pod[i] = table.calc_HR()
-        pofd[i] = table.calc_FARate()
-
-    # Stash the result in the results dictionary:
-    results[m] = {'heidke': heidke,
-                  'bias': bias,
-                  'pod': pod,
-                  'pofd': pofd}
+    # Bin the data once, then evaluate every model threshold at which the
+    # counts change; the curves and optima are exact.
+    binned = mmt.build_binned(m)
+    results[m] = mmt.threshold_curve(binned, thresh)
+    optimal[m] = {metric: mmt.optimize_threshold(binned, thresh, metric)
+                  for metric in ('bias', 'hss', 'pod', 'pss')}
+    store.add_rows([({'forecast': m, 'thresh': thresh,
+                      'modthresh': best['modthresh']},
+                     {k: best[k] for k in store.counts})
+                    for best in optimal[m].values()])
 
 # Create a figure to plot results:
 fig, axes = plt.subplots(2, 2, figsize=[8, 8])
 axes = axes.flatten()
 
-# Plot'em.
+# Plot'em.  Each value holds from its threshold down to the next one.
 for m in mmt.models:
-    axes[0].plot(threshes, results[m]['heidke'], label=mmt.models[m])
-    axes[1].plot(threshes, results[m]['bias'], label=None)
-    axes[2].plot(threshes, results[m]['pod'], label=None)
-    axes[3].plot(threshes, results[m]['pofd'], label=None)
+    curve = results[m]
+    loc = (curve['modthresh'] >= tmin) & (curve['modthresh'] <= thresh)
+    for ax, x, lab in zip(axes, ('hss', 'bias', 'pod', 'pofd'),
+                          (mmt.models[m], None, None, None)):
+        ax.step(curve['modthresh'][loc], curve[x][loc], where='post',
+                label=lab)
 
 # Details details.
 fig.legend(loc='lower center', ncol=3)
@@ -68,18 +58,13 @@ fig.suptitle('Forecast vs. Model Threshold')
 fig.subplots_adjust(top=0.949, bottom=0.167, left=0.107,
                     right=0.972, hspace=0.26, wspace=0.286)
 
-
-# For finding max threshold
-for m in mmt.models:
-    y_h = results[m]['heidke'].argmax()
-    print(m, "heidke Max:", threshes[y_h])
-    y_p = results[m]['pod'].argmax()
-    print(m, "PoD Max:", threshes[y_p])
-    y_f = results[m]['pofd'].argmax()
-    print(m, "PoFD Max:", threshes[y_f], "\n")
-
-#Calculating optimized bias
+# Optimal model thresholds:
+names = {'hss': 'heidke Max', 'pod': 'PoD Max', 'pss': 'PoD-PoFD Max',
+         'bias': 'Optimized Bias'}
 for m in mmt.models:
-        b_dist =  abs(1-(results[m]['bias']))
-        b_loc= b_dist.argmin()
-        print(m,"Optimized Bias:", threshes[b_loc])
+    for metric, best in optimal[m].items():
+        score = best['pod'] - best['pofd'] if metric == 'pss' \
+            else best[metric]
+        print(m, f"{names[metric]}: {best['modthresh']:.4f}",
+              f"({metric} = {score:.3f})")
+    print()
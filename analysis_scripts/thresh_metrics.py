@@ -22,20 +22,39 @@ parser.add_argument('-mt', "--modthresh", type=float, default=0.3,
                     "Optimized bias threshold for each model is as follows:" +
                     "LFM-MIX = 0.151, Weigel = 0.084, OpenGGCM = 0.205," +
                     "Weimer = 0.057, and SWMF = 0.205.")
+parser.add_argument("--no-cache", action="store_true",
+                    help="Always parse the text data files instead of " +
+                    "using the binary cache in mmt.cachedir.")
+parser.add_argument("-j", "--jobs", type=int, default=1,
+                    help="Number of worker processes used to read and bin " +
+                    "data files; 0 uses all CPUs. Defaults to 1.")
+parser.add_argument("--profile", nargs='?', const='', metavar='PSTATS',
+                    help="Print a breakdown of time spent per stage " +
+                    "(reading, parsing, binning, etc.) at exit. If a file " +
+                    "name is given, also save cProfile statistics there.")
 
 # Process arguments
 args = parser.parse_args()
+mmt.use_cache = not args.no_cache
+if args.profile is not None:
+    mmt.enable_profile(pstats=args.profile or None)
 
 # script options into function arguments?
 tab_kwargs = {'event_set': args.events, 'mag_set': args.mag,
-              'thresh': args.thresh, 'modthresh': args.modthresh}
+              'thresh': args.thresh, 'modthresh': args.modthresh,
+              'jobs': args.jobs}
 
 # Deterministic table
 swmf = mmt.build_table('9_SWMF', **tab_kwargs)
 
+# Metrics are also added to the results store for use by plotting scripts:
+store = mmt.ResultsStore()
+
 # Tables for each model
 for m in mmt.models:
     mod_tab = mmt.build_table(m, **tab_kwargs)
+    store.add(mod_tab, m, events=args.events, mags=args.mag,
+              thresh=args.thresh, modthresh=args.modthresh)
     print(m, f"PoD: {mod_tab.calc_HR():+6.3f}")
     print(m, f"PoFD: {mod_tab.calc_FARate():+6.3f}")
     print(m, f"Heidke: {mod_tab.calc_heidke():+6.3f}")
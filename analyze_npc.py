@@ -10,14 +10,9 @@ analysis tools. See that manuscript for details.
 '''
 
 import os, sys
-from datetime import datetime, timedelta
+from datetime import datetime
 from argparse import ArgumentParser
 
-import numpy as np
-import matplotlib.pyplot as plt
-
-from spacepy.plot import style, applySmartTimeTicks
-from validator import BinaryEventTable
 import multimodtools as mmt
 
 # Handle command-line arguments.
@@ -46,12 +41,22 @@ parser.add_argument("-m", "--mags", nargs='+', type=str,
                     "'all' for high latitude, mid-latitude, or both. " +
                     "e.g., --mags all hi low pbq, would run 'hi' and 'low' " +
                     "magnetometers and the PBQ station by itself.")
+parser.add_argument("--no-cache", action="store_true",
+                    help="Always parse the text data files instead of " +
+                    "using the binary cache in mmt.cachedir.")
+parser.add_argument("-j", "--jobs", type=int, default=1,
+                    help="Number of worker processes used to read and bin " +
+                    "data files; 0 uses all CPUs. Defaults to 1.")
+parser.add_argument("--profile", nargs='?', const='', metavar='PSTATS',
+                    help="Print a breakdown of time spent per stage " +
+                    "(reading, parsing, binning, etc.) at exit. If a file " +
+                    "name is given, also save cProfile statistics there.")
 
 # Process arguments:
 args = parser.parse_args()
-
-# Switch to spacepy's style:
-style()
+mmt.use_cache = not args.no_cache
+if args.profile is not None:
+    mmt.enable_profile(pstats=args.profile or None)
 
 # Build output directory path (just "npc_debug" in debug mode...)
 now = datetime.now() # Time of current run
@@ -81,42 +86,28 @@ outfile.write(f"\tMagnetometer sets used: {args.mags}\n")
 outfile.write(f'\tOutput directory (ignored in debug mode):\n')
 outfile.write(f"\t\t{fulldir}\n")
 
+# Metrics are also added to the results store for use by plotting scripts:
+store = mmt.ResultsStore()
+key = {'events': args.events, 'thresh': args.threshold}
+
 ####### Create top-level binary event tables and NPC #######
+# Bin all 5 models against the observations once, for every station in any
+# group; each group is then a selection of windows from the same cube.
+allcube = mmt.EnsembleCube(event_set=args.events,
+                           mag_set=mmt.union_mags(args.mags), jobs=args.jobs)
+
 # Loop over the key mag groupings: all, hi, lo
 for group in args.mags:
-    # Turn our script options into function arguments:
-    tab_kwargs = {'event_set':args.events, 'mag_set':group,
-                  'thresh':args.threshold, 'verbose':False}
-
-    # Create tables for all 5 models:
-    tables = {}
-    for m in mmt.models:
-        tables[mmt.models[m]] = mmt.build_table(m, **tab_kwargs)
+    cube = allcube.select(mag_set=group)
 
     # Convenience variable for printing our reference forecast:
-    det = tables["SWMF"]
+    det = cube.table('9_SWMF', args.threshold)
 
     # Create NPC by counting the number of crossings in each bin
     # across all ensemble members (i.e., models)
-    npc_size, obs_size = tables['SWMF'].obsmax.size, tables['SWMF'].Obs.size
-    mod = np.zeros(tables['SWMF'].obsmax.size)
-    for tab in tables:
-        mod += 1*tables[tab].bool
-    npc_forecast = 1.1 * args.threshold * (mod>=2)
-
-    # Create a synthetic time series to match the number of data points.
-    # Doing this instead of relying on the original times, with multi-year
-    # long gaps, greatly speeds processing.
-    tstart = datetime(2000,1,1,0,0,0)
-    t_npc = [tstart + timedelta(minutes=i*20 + 10) for i in range(npc_size)]
-    t_npc = np.array(t_npc)
-
-    # Build table using times/dates and observed values from all included
-    # events, stored in any of the other tables (but we'll use SWMF for ease.)
-
-    npc = BinaryEventTable(t_npc, tables['SWMF'].obsmax,
-                           t_npc, npc_forecast, args.threshold, window=20*60,
-                           verbose=False)
+    npc = cube.npc_table(args.threshold, n_models=args.n_models)
+    store.add(det, '9_SWMF', mags=group, **key)
+    store.add(npc, 'NPC', mags=group, n_required=args.n_models, **key)
 
     # Compare the deterministic and ensemble forecast; write results to file.
     outfile.write(40*'='+'\n')
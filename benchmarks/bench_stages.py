@@ -0,0 +1,114 @@
+#!/usr/bin/env python
+'''
+Benchmarks for the main stages of the analysis, run against the bundled
+data with pytest-benchmark.  From the top of the repository:
+
+    python -m pytest benchmarks/bench_stages.py --benchmark-autosave
+
+saves a JSON baseline under `.benchmarks/`, named after the current commit.
+Compare a later run against it with:
+
+    python -m pytest benchmarks/bench_stages.py --benchmark-compare
+
+Besides timings, each benchmark records in its "extra_info" the number of
+data rows read ('rows'), the throughput ('rows_per_s', from the mean
+time), and the peak memory traced during a single call ('peak_mb').
+'''
+
+import tracemalloc
+
+import numpy as np
+import pytest
+
+import multimodtools as mmt
+
+datadir = mmt.install_dir + 'data/'
+
+# Single files in each of the main formats:
+files = {'swmf': datadir + 'deltaB/Event1/9_SWMF/9a/YKC_9a_SWMF_Event1.txt',
+         'weigel': datadir + 'dBdt/Event2/3_WEIGEL/YKC_3_WEIGEL_Event2.txt',
+         'obs': datadir + 'dBdt/Event2/Observations/ykc_OBS_20061214.txt'}
+
+
+@pytest.fixture(autouse=True, scope='module')
+def cache(tmp_path_factory):
+    '''Use a fresh binary cache so results do not depend on its state.'''
+
+    orig = mmt.cachedir
+    mmt.cachedir = str(tmp_path_factory.mktemp('cache')) + '/'
+    yield
+    mmt.cachedir = orig
+    mmt.clear_memo()
+
+
+def run(benchmark, func, rounds=5):
+    '''
+    Time *func*, clearing the memo of `read_ccmcfile` before every round,
+    and record rows read, rows per second, and peak memory.  Untimed calls
+    first fill the binary cache and then measure memory.
+    '''
+
+    func()
+    mmt.clear_memo()
+    tracemalloc.start()
+    result = func()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    rows = mmt.memo_info()['rows']
+
+    benchmark.pedantic(func, setup=mmt.clear_memo, rounds=rounds)
+    benchmark.extra_info.update(rows=rows, peak_mb=peak / 2**20)
+
+    # There are no timings under --benchmark-disable:
+    if benchmark.stats is not None:
+        benchmark.extra_info['rows_per_s'] = \
+            rows / benchmark.stats.stats.mean
+
+    return result
+
+
+@pytest.mark.parametrize('cached', [False, True], ids=['text', 'cached'])
+@pytest.mark.parametrize('name', list(files))
+def test_parse(benchmark, name, cached):
+    '''Read a single file, from text or from the binary cache.'''
+    data = run(benchmark,
+               lambda: mmt.read_ccmcfile(files[name], cache=cached), 20)
+    assert data['time'].size > 0
+
+
+def test_build_table(benchmark):
+    '''Full binary event table for one model, all events and stations.'''
+    table = run(benchmark, lambda: mmt.build_table('9_SWMF', verbose=False))
+    assert table['hit'] > 0
+
+
+def npc_build():
+    '''The 5-model NPC build of `analyze_npc.py` for all mag groups.'''
+
+    results = {}
+    allcube = mmt.EnsembleCube(mag_set=mmt.union_mags(['all', 'hi', 'lo']))
+    for group in ['all', 'hi', 'lo']:
+        cube = allcube.select(mag_set=group)
+        results[group] = (cube.table('9_SWMF', 0.3),
+                          cube.npc_table(0.3, n_models=2))
+
+    return results
+
+
+def test_npc(benchmark):
+    '''See `npc_build`.'''
+    results = run(benchmark, npc_build)
+    assert results['all'][1]['hit'] > 0
+
+
+def thresh_sweep():
+    '''The exact model threshold curves of `explore_thresh.py`.'''
+
+    return {m: mmt.threshold_curve(mmt.build_binned(m), .3)
+            for m in mmt.models}
+
+
+def test_thresh_sweep(benchmark):
+    '''See `thresh_sweep`.'''
+    results = run(benchmark, thresh_sweep)
+    assert results['9_SWMF']['hss'].size > 21
@@ -4,96 +4,165 @@ CCMC has *many* issues with their file formats, including double-headers and
 incorrect units.  Let's write a script to dig through the files and correct
 this behavior.
 
-This script is pretty hacky, but we just need to fix these files.
+Every data file (all quantities, events, models, and observations) is
+checked by reading only its header bytes.  A header needs fixing if it
+
+- is missing altogether,
+- holds more than one variable name line (a "double header"),
+- names the wrong quantity (dB/dt vs. delta-B) for the file's directory, or
+- gives the wrong units for the N-E-Z columns.
+
+Bad headers are replaced by the correct one; the `#` comment lines before
+it are kept and the data are copied unchanged.  Each fix is written to a
+temporary file next to the original and then moved over it, so an
+interrupted run never leaves a partial file behind.
+
+Use `--dry-run` to only report, as JSON, what would change.
 '''
 
 import os
+import sys
+import json
+import shutil
+import tempfile
+from argparse import ArgumentParser, RawDescriptionHelpFormatter
+from concurrent.futures import ThreadPoolExecutor
 
-def fix_file(f, ftype='dBdt', replace=True):
-    '''
-    Open text data file *f*, read header, and fix as necessary.
+import multimodtools as mmt
 
-    Returns boolean indicating action taken:
-       True:  File was incorrect, now fixed.
-       False: File was fine, no action taken.
+
+def correct_header(quantity='dBdt'):
+    '''
+    Return the correct variable name and units lines (as bytes) for a file
+    holding *quantity*, either 'dBdt' or 'deltaB'.
     '''
 
-    units = 'nT' if ftype=='B' else 'nT/s'
-    
-    # Set correct header based on expected file type (B vs. dB/dt):
-    header = f'''Year Month Day Hour Min Sec GeomagLat GeomagLon {ftype}_NorthGeomag {ftype}_EastGeomag {ftype}_DownGeomag
-[year] [month] [day] [hour] [min] [s] [deg] [deg] [{units}] [{units}] [{units}]
-'''
-    
-    with open(f, 'r') as infile:
+    ftype = 'dBdt' if quantity == 'dBdt' else 'B'
+    units = 'nT/s' if quantity == 'dBdt' else 'nT'
 
-        # Load hash-tag-prefixed lines:
-        prehead = [infile.readline()]
-        while prehead[-1][0] == '#':
-            prehead.append(infile.readline())
+    return (f'Year Month Day Hour Min Sec GeomagLat GeomagLon '
+            f'{ftype}_NorthGeomag {ftype}_EastGeomag {ftype}_DownGeomag\n'
+            f'[year] [month] [day] [hour] [min] [s] [deg] [deg] '
+            f'[{units}] [{units}] [{units}]\n').encode()
 
-        # Pop the final line:
-        line = prehead.pop(-1)
 
-        # Check if this is the expected header:
-        if ftype in line:
-            # File is fine, return False to indicate no action taken.
-            return False
-        else:
-            # File is borked; cycle through bad header.
-            while 'year' in line.lower():
-                line = infile.readline()
-
-        # Create temporary file, dump preheader and header to it.
-        with open('tmp.txt', 'w') as outfile:
-            # Dump pre-header (hashtagged lines) to file:
-            for l in prehead:
-                outfile.write(l)
-            # Add corrected header w/ correct units:
-            outfile.write(header)
-            # Dump our first line of data:
-            outfile.write(line)
-            # Read and dump rest of data:
-            for l in infile.readlines():
-                outfile.write(l)
-
-    # Replace bad file with good file:
-    if replace:
-        os.rename('tmp.txt', f)
-
-    return True
-        
-if __name__ == '__main__':
-
-    from multimodtools import tlims, models, allmag, datadir
+def check_file(f, quantity='dBdt'):
+    '''
+    Read the header of text data file *f*, which should hold *quantity*
+    values, and return a report of its problems as a dictionary:
+    'file', 'quantity', 'dialect', 'problems' (a list, empty if the header
+    is fine), 'offset' (byte offset of the data), and 'header' and 'fixed'
+    (the current and corrected header text).
+    '''
 
-    # How many files are we fixing? Keep track!
-    nFixed = 0
-    
-    # Right now, only correct observation files.
-    # Loop over all events and stations like so:
-    for ev in [1,2,3,4,7,8]:
-        for mag in allmag:
-            for t in ['dBdt', 'deltaB']:
-                # Set our file type based on our path:
-                ftype = t
-                if 'delta' in ftype: ftype='B'
+    sniff = mmt.sniff_header(f)
+    with open(f, 'rb') as infile:
+        header = infile.read(sniff['offset'])
+    lines = header.splitlines(keepends=True)
+
+    varlines = [line for line in lines if b'Year' in line]
+    unitlines = [line for line in lines if line.lstrip(b'# ').startswith(b'[')]
+    units = '[nT/s]' if quantity == 'dBdt' else '[nT]'
+
+    problems = []
+    if not varlines:
+        problems.append('missing')
+    if len(varlines) > 1:
+        problems.append('double')
+    if any((b'dBdt' in line) != (quantity == 'dBdt') for line in varlines):
+        problems.append('quantity')
+    if any([u.decode() for u in line.split()[-3:]] != [units]*3
+           for line in unitlines):
+        problems.append('units')
+
+    # Keep the comment lines that come before the (first) header:
+    prehead = b''
+    for line in lines:
+        if not line.startswith(b'#') or line in varlines or line in unitlines:
+            break
+        prehead += line
+
+    return {'file': f, 'quantity': quantity, 'dialect': sniff['dialect'],
+            'problems': problems, 'offset': sniff['offset'],
+            'header': header.decode(errors='replace'),
+            'fixed': (prehead + correct_header(quantity)).decode(
+                errors='replace') if problems else None}
+
+
+def fix_file(f, quantity='dBdt', replace=True):
+    '''
+    Open text data file *f*, read header, and fix as necessary.
 
-                # File we want to change:
-                f_obs=datadir+f'/dBdt/Event{ev}/Observations/{mag.lower()}' \
-                    + f'_OBS_{tlims[ev][0]:%Y%m%d}.txt'
+    Returns the report of `check_file`; its 'problems' list is empty if the
+    file was fine and no action was taken.  If *replace* is False, nothing
+    is written (a dry run).
+    '''
 
-                # It may not exist- not all mags for all events.
-                if not os.path.exists(f_obs): continue
+    report = check_file(f, quantity)
+    if not (report['problems'] and replace):
+        return report
+
+    # Write the new header and the unchanged data to a temporary file in
+    # the same directory, then move it over the original in one step:
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(f) or '.',
+                               prefix='.' + os.path.basename(f),
+                               suffix='.tmp')
+    try:
+        with open(fd, 'wb') as outfile, open(f, 'rb') as infile:
+            outfile.write(report['fixed'].encode())
+            infile.seek(report['offset'])
+            shutil.copyfileobj(infile, outfile, 2**20)
+        shutil.copymode(f, tmp)
+        os.replace(tmp, f)
+    except BaseException:
+        os.remove(tmp)
+        raise
+
+    return report
 
-                # If it does exist, fix!
-                result = fix_file(f_obs, ftype=ftype, replace=True)
 
-                # Count up those effed files.
-                nFixed += 1*result
+if __name__ == '__main__':
 
-                if result: print(f"FIXED file {f_obs}")
+    parser = ArgumentParser(description=__doc__,
+                            formatter_class=RawDescriptionHelpFormatter)
+    parser.add_argument('-j', '--jobs', type=int, default=8,
+                        help='Number of files to check at once ' +
+                        '(default: 8; 0 means one per CPU)')
+    parser.add_argument('--dry-run', nargs='?', const='-', default=None,
+                        metavar='REPORT',
+                        help='Change nothing; write a JSON report of what ' +
+                        'would change to REPORT (default: stdout)')
+    args = parser.parse_args()
+
+    # Catalog of all data files:
+    cat = mmt.get_catalog()
+    files = [(cat.get(*key), key[0]) for key in cat]
+
+    replace = args.dry_run is None
+    with ThreadPoolExecutor(max_workers=args.jobs or os.cpu_count()) as pool:
+        reports = list(pool.map(lambda a: fix_file(*a, replace=replace),
+                                files))
+    fixes = [r for r in reports if r['problems']]
+
+    if not replace:
+        out = {'checked': len(reports), 'to_fix': len(fixes),
+               'files': fixes}
+        if args.dry_run == '-':
+            json.dump(out, sys.stdout, indent=1)
+            print()
+        else:
+            with open(args.dry_run, 'w') as f:
+                json.dump(out, f, indent=1)
+            print(f"{len(fixes)} of {len(reports)} files would be fixed; " +
+                  f"see {args.dry_run}.")
+        sys.exit()
 
+    for r in fixes:
+        print(f"FIXED file {r['file']} ({', '.join(r['problems'])})")
 
     # Print status report:
-    print(f"\nI fixed {nFixed} files.")
+    print(f"\nI fixed {len(fixes)} files.")
+
+    # Cached copies of rewritten files are stale; start fresh.
+    if fixes:
+        print(f"Cleared {mmt.clear_cache()} cached data files.")
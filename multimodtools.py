@@ -6,20 +6,55 @@ It contains tools to read data files, create ensembles, etc.
 '''
 
 import os
-import datetime as dt
+import sys
+import copy
+import json
+import hashlib
+import itertools
+import contextlib
+from time import perf_counter
+from collections import OrderedDict, Counter
 
 import numpy as np
-from dateutil.parser import parse as par
 
 # Get install directory:
-if __name__ != '__main__':
-    install_dir = '/'.join(__loader__.path.split('/')[:-1])+'/'
-else:
-    install_dir = ''
+install_dir = os.path.dirname(os.path.abspath(__file__)) + '/'
 
 # Get path to data directory:
 datadir = install_dir+'data/'
 
+# Binary cache of parsed data files.  Set the MMT_CACHEDIR environment
+# variable to move it; set *use_cache* to False to always parse text.
+cachedir = os.environ.get('MMT_CACHEDIR', datadir+'.cache/')
+use_cache = True
+
+# Bump whenever the parser output changes to invalidate old cache files:
+_parser_version = 1
+
+# In-process memo of parsed files: maximum size in bytes and hit/miss counts.
+memo_maxbytes = 512 * 2**20
+memo_stats = {'hits': 0, 'misses': 0}
+_memo = OrderedDict()
+
+# Consolidated columnar store of the whole archive (see build_store):
+storedir = os.environ.get('MMT_STOREDIR', datadir+'.store/')
+_store = {}
+
+# Catalog of data files (see get_catalog):
+_catalog = None
+
+# Stored forecast metrics (see ResultsStore).  Set the MMT_RESULTS
+# environment variable to move the database file.
+resultsfile = os.environ.get('MMT_RESULTS', datadir+'.results.sqlite')
+
+# Opt-in stage timers and counters (see enable_profile).  Set the
+# MMT_PROFILE environment variable to 1 to turn them on for a whole run and
+# MMT_PSTATS to a file name to also dump cProfile statistics there.
+profile = False
+profile_stats = {}
+_stage_stack = []
+_pstats = {}
+
 # Critical constants for handling SWPC events/models/stations etc.
 models = {'2_LFM-MIX': 'LFM-MIX',
           '3_WEIGEL': 'Weigel',
@@ -41,220 +76,3017 @@ for m, c in zip(modnames, colnames):
 
 allmag = hilat+lolat
 
-# Time limits of the events:
-tlims = {1: (par('October 29th, 2003 06:00UT', ignoretz=True),
-             par('October 30th, 2003 06:00UT', ignoretz=True)),
-         2: (par('December 14, 2006 12:00 UT', ignoretz=True),
-             par('December 16, 2006 00:00 UT', ignoretz=True)),
-         3: (par('August 31, 2001 00:00 UT',   ignoretz=True),
-             par('September 1, 2001 00:00 UT', ignoretz=True)),
-         4: (par('August 31, 2005 10:00 UT',   ignoretz=True),
-             par('September 1, 2005 12:00 UT', ignoretz=True)),
-         7: (par('April 5, 2010 00:00 UT',     ignoretz=True),
-             par('April 6, 2010, 00:00 UT',    ignoretz=True)),
-         8: (par('August 5, 2011 09:00 UT',    ignoretz=True),
-             par('August 6, 2011, 09:00 UT',   ignoretz=True))}
+# Time limits of the events (use `tlims[n].astype(object)` for datetimes):
+tlims = {1: np.array(['2003-10-29T06:00', '2003-10-30T06:00'], 'M8[s]'),
+         2: np.array(['2006-12-14T12:00', '2006-12-16T00:00'], 'M8[s]'),
+         3: np.array(['2001-08-31T00:00', '2001-09-01T00:00'], 'M8[s]'),
+         4: np.array(['2005-08-31T10:00', '2005-09-01T12:00'], 'M8[s]'),
+         7: np.array(['2010-04-05T00:00', '2010-04-06T00:00'], 'M8[s]'),
+         8: np.array(['2011-08-05T09:00', '2011-08-06T09:00'], 'M8[s]')}
 
 # Store binary event threshold values:
 thres_dt = [0.3, 0.7, 1.1, 1.5]  # nT/s
 thres_db = [101.6, 213.6, 317.5, 416.7]  # nT
 
 
-def read_ccmcfile(filename):
+@contextlib.contextmanager
+def _stage(name):
     '''
-    Read and parse a single SWPC file.
+    Time the enclosed block as stage *name* if *profile* is on, and yield a
+    `Counter` for the block to add its counts to (files, rows, etc.).
+    Times are exclusive: time spent in nested stages is not included.
+    '''
+
+    counts = Counter()
+    if not profile:
+        yield counts
+        return
+
+    _stage_stack.append(0.0)
+    start = perf_counter()
+    try:
+        yield counts
+    finally:
+        elapsed = perf_counter() - start
+        nested = _stage_stack.pop()
+        if _stage_stack:
+            _stage_stack[-1] += elapsed
+
+        stats = profile_stats.setdefault(name, Counter())
+        stats['calls'] += 1
+        stats['seconds'] += elapsed - nested
+        stats.update(counts)
 
-    Results are returned as a dictionary containing 'time', the three
-    components of either deltaB (perturbation of field from quiet time
-    values) or dB/dt in N-E-Z coordinates, and the "H" component (tangent
-    to surface) as defined in the Pulkkinen et al study.
 
+def _count(name, **counts):
+    '''Add *counts* to stage *name* without timing anything.'''
+    if profile:
+        profile_stats.setdefault(name, Counter()).update(counts)
+
+
+def enable_profile(pstats=None, report=True):
     '''
+    Turn on the stage timers and counters of this module.  The time spent
+    in, and the counts of files, bytes, rows, windows, cache hits, etc. for,
+    each stage (reading, parsing, catalog lookups, binning, table building
+    and merging) are kept in *profile_stats*; see `profile_report`.
 
-    # Start by opening our file:
-    with open(filename, 'r') as f:
-        # Parse header- we only care about figuring out if this is a
-        # deltaB or dB/dt file.  This will be given in the variable name
-        # line.
-        trash = '    '
-        while 'Year' not in trash:
-            trash = f.readline()
+    This is done automatically on import if the MMT_PROFILE environment
+    variable is set to 1.  Only work done in this process is counted, so
+    use `jobs=1` when profiling.
+
+    Other Parameters
+    ================
+    pstats : str, default=None
+        If given, also run `cProfile` and dump its statistics to this file
+        at exit, for use with `pstats` or `snakeviz`.
+    report : bool, default=True
+        Print `profile_report` to stderr at exit.
 
-        # Look for dBdt in variable names to determine data type:
-        is_dBdt = True if 'dBdt' in trash else False
+    '''
 
-        # Skip units line:
-        trash = f.readline()
+    global profile
+    import atexit
 
-        # Slurp remainder of file:
-        lines = f.readlines()
+    if not profile and report:
+        atexit.register(profile_report, file=sys.stderr)
+    profile = True
 
-    # Create output container:
-    data = {}  # Empty dictionary
-    nlines = len(lines)  # number of data entries
+    if pstats and not _pstats:
+        import cProfile
+        _pstats[pstats] = cProfile.Profile()
+        _pstats[pstats].enable()
+        atexit.register(_dump_pstats)
 
-    # Time is a special data type (datetimes):
-    data['time'] = np.zeros(nlines, dtype=object)
 
-    # All others get set based on type of data in file:
-    for v in ['bn', 'be', 'bz']:
-        data['d'*is_dBdt + v] = np.zeros(nlines)
+def _dump_pstats():
+    '''Stop cProfile and write its statistics (see `enable_profile`).'''
+    for filename, prof in _pstats.items():
+        prof.disable()
+        prof.dump_stats(filename)
+
+
+def profile_report(file=None):
+    '''
+    Print a table of time and counts per stage, slowest first, from
+    *profile_stats* to *file* (default: stdout).
+    '''
+
+    file = sys.stdout if file is None else file
+    total = sum(stats['seconds'] for stats in profile_stats.values())
+
+    file.write(f"{'Stage':10s} {'Calls':>8s} {'Seconds':>9s} {'%':>6s}  " +
+               'Counts\n' + 60*'-' + '\n')
+    for name, stats in sorted(profile_stats.items(),
+                              key=lambda x: -x[1]['seconds']):
+        counts = ' '.join(f'{k}={v}' for k, v in sorted(stats.items())
+                          if k not in ('calls', 'seconds'))
+        percent = 100 * stats['seconds'] / total if total else 0
+        file.write(f"{name:10s} {stats['calls']:8d} " +
+                   f"{stats['seconds']:9.3f} {percent:6.1f}  {counts}\n")
+    file.write(f"{'Total':10s} {'':8s} {total:9.3f}\n")
+
+
+if os.environ.get('MMT_PROFILE', '0') not in ('', '0'):
+    enable_profile(os.environ.get('MMT_PSTATS'))
+
+
+# Columns read from data files: date, time, and the final three (N-E-Z).
+_usecols = (0, 1, 2, 3, 4, -3, -2, -1)
+
+
+def _ymdhms_to_datetime64(year, month, day, hour, minute, second):
+    '''
+    Convert integer arrays of calendar fields into a `datetime64[s]` array
+    without a per-element Python loop.
+    '''
+
+    # Build the calendar date first (year/month/day), then add the clock:
+    date = (year - 1970).astype('datetime64[Y]') + \
+        (month - 1).astype('timedelta64[M]')
+    date = date.astype('datetime64[D]') + (day - 1).astype('timedelta64[D]')
+
+    return date.astype('datetime64[s]') + \
+        (3600*hour + 60*minute + second).astype('timedelta64[s]')
+
+
+# Header dialects of the SWPC files, recognized by the start of the first
+# line.  Files without any header are 'bare'.
+_dialects = ((b'# CCMC run', 'ccmc'),
+             (b'#Campaign GEM', 'gem'),
+             (b'#Compaign CEDAR-GEM', 'gem'),
+             (b'# model: Weimer', 'weimer'),
+             (b'# model: Weigel', 'weigel'))
+
+
+def sniff_header(filename, nbytes=512):
+    '''
+    Classify the header of a single SWPC file by reading only its first few
+    hundred bytes, continuing in steps of *nbytes* only if the header is
+    longer than that.  Returns a dictionary with:
+
+    - 'dialect': the header style, one of 'ccmc', 'gem', 'weimer',
+      'weigel', 'bare' (no header), or 'unknown'.
+    - 'quantity': 'dBdt' or 'deltaB', from the variable name line or, if
+      there is none, from *filename*.
+    - 'offset': byte offset of the first line of data (the file size if
+      there is no data).
+    - 'ncols': number of columns of data (0 if there is no data).
+    - 'usecols': indices of the date/time and N-E-Z columns.
+
+    Files with two headers (some of the GEM dB/dt observations) are
+    handled: the variable names and offset come from the last header.
+
+    Examples
+    ========
+    >>> path = 'dBdt/Event2/9_SWMF/YKC_9_SWMF_Event2.txt'
+    >>> mmt.sniff_header(mmt.datadir + path)
+    {'dialect': 'ccmc', 'quantity': 'dBdt', 'offset': 426, 'ncols': 11,
+     'usecols': [0, 1, 2, 3, 4, 8, 9, 10]}
+
+    '''
+
+    with _stage('sniff') as counts, open(filename, 'rb') as f:
+        buf, pos, varline, first = f.read(nbytes), 0, b'', None
+
+        # Walk the header line by line, looking for the last variable name
+        # line and the first line that starts with a number:
+        while True:
+            end = buf.find(b'\n', pos)
+            if end < 0:
+                more = f.read(nbytes)
+                if more:
+                    buf += more
+                    continue
+                end = len(buf)
+                if pos == end:
+                    break
+            line = buf[pos:end]
+            parts = line.split()
+            if parts and parts[0].isdigit():
+                first = parts
+                break
+            if b'Year' in line:
+                varline = line
+            pos = end + 1
+
+        counts.update(files=1, bytes=len(buf))
+
+    for start, dialect in _dialects:
+        if buf.startswith(start):
+            break
+    else:
+        dialect = 'bare' if pos == 0 else 'unknown'
+
+    # Look for dBdt in variable names to determine data type.  If there
+    # is no header at all, fall back to the directory layout:
+    is_dBdt = b'dBdt' in varline if varline else 'dBdt' in filename
+
+    ncols = len(first) if first else 0
+    usecols = [ncols + i if i < 0 else i for i in _usecols] if ncols else []
+
+    return {'dialect': dialect, 'quantity': 'dBdt' if is_dBdt else 'deltaB',
+            'offset': pos if first else len(buf), 'ncols': ncols,
+            'usecols': usecols}
+
+
+def _header(filename):
+    '''
+    Return the header of *filename* (see `sniff_header`), from the catalog
+    if one has been built.
+    '''
+
+    if _catalog is None:
+        return sniff_header(filename)
+
+    return _catalog.header(filename)
+
+
+def _to_records(raw, is_dBdt):
+    '''
+    Convert the parsed date/time and N-E-Z columns, *raw*, into the
+    structured record array returned by `_parse_ccmcfile`.
+    '''
+
+    # Create output container; field names follow the type of data in file:
+    names = ['time'] + ['d'*is_dBdt + v for v in ['bn', 'be', 'bz']]
+    recs = np.zeros(raw.shape[0], dtype=[(names[0], 'datetime64[s]')] +
+                    [(v, 'float64') for v in names[1:]])
 
     # CCMC introduced lots of error in the "second" column of the time
     # entry: instead of 0 or 30, we find 30.5 or other values.  This affects
     # analysis.  So, set seconds for time entries based on file type.
-    seconds = ' 30' if is_dBdt else ' 00'
+    seconds = 30 if is_dBdt else 0
 
-    # Loop through and parse all data lines:
-    for i, l in enumerate(lines):
-        parts = l.split()
+    # Time is a special data type (datetimes):
+    ymdhm = raw[:, :5].astype(int)
+    recs['time'] = _ymdhms_to_datetime64(*ymdhm.T, seconds)
 
-        # Extract date time:
-        t = ' '.join(parts[:5]) + seconds
-        data['time'][i] = dt.datetime.strptime(t, '%Y %m %d %H %M %S')
+    for i, v in enumerate(names[1:]):
+        recs[v] = raw[:, 5+i]
 
-        # Parse remaining values:
-        for v, x in zip(['bn', 'be', 'bz'], parts[-3:]):
-            data['d'*is_dBdt + v][i] = x
+    return recs
 
-    # Mask NaNs:
-    for v in ['bn', 'be', 'bz']:
-        data['d'*is_dBdt + v] = np.ma.masked_invalid(data['d'*is_dBdt + v])
 
-    # Calculate h component:
-    data['d'*is_dBdt + 'bh'] = np.sqrt(data['d'*is_dBdt + 'bn']**2 +
-                                       data['d'*is_dBdt + 'be']**2)
+def _parse_ccmcfile(filename):
+    '''
+    Parse the text of a single SWPC file into a structured record array
+    with a `datetime64[s]` field, 'time', and one float field per N-E-Z
+    component ('bn', 'be', 'bz' or 'dbn', 'dbe', 'dbz').
 
-    # Return data object to caller:
-    return data
+    The header is classified by `sniff_header` (or looked up in the
+    catalog); the numeric block that follows it is parsed in a single call
+    to `numpy.loadtxt`.
+    '''
 
+    header = _header(filename)
+    is_dBdt = header['quantity'] == 'dBdt'
 
-def build_table(model,  event_set='all', mag_set='all', thresh=0.3,
-                window=20, debug=False, verbose=True, modthresh=None):
+    with _stage('parse') as counts, open(filename, 'r') as f:
+        # Jump straight to the first data line, then parse date/time fields
+        # and the final three (N-E-Z) columns in one go:
+        if header['ncols']:
+            f.seek(header['offset'])
+            raw = np.loadtxt(f, comments='#', usecols=header['usecols'],
+                             ndmin=2)
+        else:
+            raw = np.zeros((0, 8))
+
+        recs = _to_records(raw, is_dBdt)
+        counts.update(files=1, bytes=os.fstat(f.fileno()).st_size,
+                      rows=recs.size)
+
+    return recs
+
+
+def iter_ccmcfile(filename, chunk_rows=100000):
     '''
-    Create a binary event table for *model* (must be member of *models* list)
-    that includes all magnetometers included in *mag_set* (can be "all", "hi",
-    or "lo") for all events listed in *event_set* and using a certain
-    threshold, *thresh*.
+    Read a single SWPC file in blocks of at most *chunk_rows* lines so that
+    arbitrarily long records can be processed in constant memory.
+
+    Each block is a dictionary in the same form as returned by `load`:
+    'time' is a `datetime64[s]` array, the N-E-Z components and the "H"
+    component are float arrays, and missing values are NaN.  Times and
+    values are identical to those of `read_ccmcfile`.
 
     Parameters
     ==========
-    model:str
-       What model to use when building the table.  See *models* list for
-       options.
+    filename : str
+        Path to the file to read.
 
     Other Parameters
     ================
-    mag_set : str or list
-        Set which group of magnetometers to use. Can be a list of 3-letter
-        magnetometer station name codes or a string indicating what group to
-        use, e.g., 'hi', 'lo', or 'all' for high latitude, mid-latitude,
-        or both.
+    chunk_rows : int, default=100000
+        Maximum number of lines parsed into each block.
 
-    event_set : list or 'all'
-        List of event numbers to include, e.g., [1,2,8], defaults to 'all'.
-        Available events are [1,2,3,4,7,8] following Pulkkinen et al., 2013.
+    Examples
+    ========
+    Find the largest observed dB/dt without reading the whole file at once:
 
-    thresh : float, default=0.3
-        Set the event threshold value; defaults to 0.3.
+    >>> peak = max(np.nanmax(block['dbh']) for block in
+    ...            mmt.iter_ccmcfile(filename, chunk_rows=1440))
 
-    modthresh : float
-        Set the threshold for the model to be different then the observation.
-        This is for experimental purposes only.
+    '''
 
-    window : int, default=20
-        Set the interval window in minutes; defaults to 20.
+    header = _header(filename)
+    is_dBdt = header['quantity'] == 'dBdt'
 
-    debug : Boolean, default=False
-        Print extra debug info to screen.
+    with open(filename, 'r') as f:
+        f.seek(header['offset'])
+
+        while True:
+            chunk = list(itertools.islice(f, chunk_rows))
+            if not chunk:
+                break
+
+            # Skip blank and comment lines; a chunk may hold no data at all:
+            rows = [x for x in chunk if x.split() and x.split()[0][0] != '#']
+            if not rows:
+                continue
+
+            raw = np.loadtxt(rows, comments='#', usecols=header['usecols'],
+                             ndmin=2)
+            recs = _to_records(raw, is_dBdt)
+            names = recs.dtype.names
+            block = {v: recs[v] for v in names}
+
+            # Calculate h component:
+            h = names[1][:-1] + 'h'
+            block[h] = np.sqrt(block[names[1]]**2 + block[names[2]]**2)
+
+            yield block
+
+
+def _cache_path(filename):
+    '''
+    Return the path of the binary cache file for *filename*.  The name
+    encodes the absolute path, modification time, size, and parser version
+    so that edited files or a new parser never hit a stale entry.
+    '''
+
+    stat = os.stat(filename)
+    key = f'{os.path.abspath(filename)}|{stat.st_mtime_ns}|{stat.st_size}|' \
+        + f'{_parser_version}'
+
+    return os.path.join(cachedir, hashlib.sha1(key.encode()).hexdigest() +
+                        '.npy')
+
+
+def _read_records(filename, cache=True):
+    '''
+    Return the record array for *filename* (see `_parse_ccmcfile`), loading
+    it memory-mapped from the on-disk cache if possible and storing it there
+    otherwise.
+    '''
+
+    if not cache:
+        return _parse_ccmcfile(filename)
+
+    with _stage('cache') as counts:
+        cfile = _cache_path(filename)
+        if os.path.exists(cfile):
+            counts.update(hits=1)
+            return np.load(cfile, mmap_mode='r')
+        counts.update(misses=1)
+
+        recs = _parse_ccmcfile(filename)
+
+        # Write to a temporary file, then move into place so that
+        # concurrent readers never see a partial cache file.  The cache is
+        # only an optimization; if it cannot be written, carry on without.
+        tmp = f'{cfile}.{os.getpid()}.tmp'
+        try:
+            os.makedirs(cachedir, exist_ok=True)
+            with open(tmp, 'wb') as f:
+                np.save(f, recs)
+            os.replace(tmp, cfile)
+        except OSError:
+            with contextlib.suppress(OSError):
+                os.remove(tmp)
+
+    return recs
+
+
+def clear_cache():
+    '''
+    Remove all binary cache files from *cachedir*, e.g., after data files
+    have been rewritten by `fix_headers.py`.  Returns the number of files
+    removed.
+    '''
+
+    if not os.path.isdir(cachedir):
+        return 0
+
+    nRemoved = 0
+    for f in os.listdir(cachedir):
+        if f.endswith('.npy') or f.endswith('.tmp'):
+            os.remove(os.path.join(cachedir, f))
+            nRemoved += 1
+
+    return nRemoved
+
+
+def _nbytes(data):
+    '''
+    Estimate the memory held by a *data* dictionary from `read_ccmcfile`.
+    '''
+
+    nbytes = 0
+    for x in data.values():
+        nbytes += x.nbytes
+        if np.ma.isMaskedArray(x):
+            nbytes += np.ma.getmaskarray(x).nbytes
+
+    return nbytes
+
+
+def clear_memo():
+    '''
+    Empty the in-process memo of `read_ccmcfile` results and reset the
+    hit/miss counters in *memo_stats*.
+    '''
+
+    _memo.clear()
+    for k in memo_stats:
+        memo_stats[k] = 0
+
+
+def memo_info():
+    '''
+    Return the number of results ('entries'), their estimated size in
+    bytes ('bytes'), and their total number of data rows ('rows') held in
+    the in-process memo of `read_ccmcfile`, as a dictionary.
+    '''
+
+    return {'entries': len(_memo),
+            'bytes': sum(n for d, n in _memo.values()),
+            'rows': sum(d['time'].size for d, n in _memo.values())}
+
+
+def read_ccmcfile(filename, cache=None, dtype=None):
+    '''
+    Read and parse a single SWPC file.
+
+    Results are returned as a dictionary containing 'time' (a
+    `datetime64[s]` array), the three components of either deltaB
+    (perturbation of field from quiet time values) or dB/dt in N-E-Z
+    coordinates as masked arrays, and the "H" component (tangent to
+    surface) as defined in the Pulkkinen et al study.
+
+    Parsed files are cached in binary form in *cachedir*; repeat reads of an
+    unchanged file skip the text parsing entirely.  Within a process,
+    results are also kept in a least-recently-used memo holding up to
+    *memo_maxbytes* bytes; hits and misses are counted in *memo_stats*.
+    The returned arrays are shared between callers and are read-only.
+
+    Other Parameters
+    ================
+    cache : bool, default=None
+        Use the on-disk cache.  Defaults to the module-level *use_cache*.
+    dtype : numpy dtype, default=None
+        If given (e.g., `numpy.float32`), return the components as plain
+        arrays of this type with NaN marking missing values instead of
+        float64 masked arrays.  Values agree with the default to the
+        precision of *dtype*; float32 holds the 4-6 significant digits of
+        the data files in well under half of the memory.
+
+    '''
+
+    if cache is None:
+        cache = use_cache
+    if dtype is not None:
+        dtype = np.dtype(dtype)
+
+    # Look for this exact file (path, size, and modification time) in memo:
+    stat = os.stat(filename)
+    key = (os.path.abspath(filename), stat.st_mtime_ns, stat.st_size, dtype)
+    if key in _memo:
+        memo_stats['hits'] += 1
+        _count('read', memo_hits=1)
+        _memo.move_to_end(key)
+        return dict(_memo[key][0])
+    memo_stats['misses'] += 1
+
+    # Convert records, timing this as the "read" stage:
+    with _stage('read') as counts:
+        recs = _read_records(filename, cache=cache)
+        counts.update(memo_misses=1, rows=recs.size)
+        names = recs.dtype.names
+
+        # Create output container:
+        data = {}  # Empty dictionary
+
+        # Time is kept as datetime64; copy it out of the (mapped) records:
+        data['time'] = np.array(recs['time'])
+
+        # Calculate h component:
+        h = names[1][:-1] + 'h'
+        if dtype is None:
+            # Mask NaNs:
+            for v in names[1:]:
+                data[v] = np.ma.masked_invalid(np.array(recs[v]))
+            data[h] = np.sqrt(data[names[1]]**2 + data[names[2]]**2)
+        else:
+            # Keep NaNs as missing values; round once from full precision:
+            for v in names[1:]:
+                data[v] = recs[v].astype(dtype)
+            data[h] = np.sqrt(recs[names[1]]**2 +
+                              recs[names[2]]**2).astype(dtype)
+
+        # Lock arrays so that callers cannot corrupt the shared copy:
+        for x in data.values():
+            x.setflags(write=False)
+            if np.ma.isMaskedArray(x):
+                np.ma.getmaskarray(x).setflags(write=False)
+
+        # Stash in memo, evicting least-recently-used entries to fit:
+        nbytes = _nbytes(data)
+        if nbytes <= memo_maxbytes:
+            _memo[key] = (data, nbytes)
+            while sum(n for d, n in _memo.values()) > memo_maxbytes:
+                _memo.popitem(last=False)
+
+    # Return data object to caller:
+    return dict(data)
+
+
+def _parse_datapath(relpath):
+    '''
+    Split the path of a data file, relative to the data directory, into its
+    (quantity, event, source, station, date) parts.  Source is the model
+    name as given in the file name (e.g., '2_LFM-MIX' or '9a_SWMF') or 'OBS'
+    for observations; date is the 'YYYYMMDD' string found in observation
+    file names (None for model files).
+    '''
+
+    parts = relpath.split(os.sep)
+    name = os.path.splitext(parts[-1])[0].split('_')
+
+    quantity, event = parts[0], int(parts[1].replace('Event', ''))
+    station = name[0].upper()
+    if name[1] == 'OBS':
+        source, date = 'OBS', name[2]
+    else:
+        source, date = '_'.join(name[1:-1]), None
+
+    return quantity, event, source, station, date
+
+
+class Catalog(object):
+    '''
+    An index of every data file under a data directory, keyed by
+    (quantity, event, source, station), where quantity is 'dBdt' or
+    'deltaB', source is a model name (e.g., '9_SWMF', or '9a_SWMF' for the
+    nested deltaB run) or 'OBS', and station is the upper-case 3-letter
+    code.
+
+    The directory tree is scanned once, classifying the header of every
+    file with `sniff_header`; the result is saved to *cachefile* and reused
+    until the modification time of any directory changes (i.e., files are
+    added, removed, or renamed).  Headers of files that have changed since
+    are sniffed again on demand (see `Catalog.header`).
+
+    Parameters
+    ==========
+    path : str, default=None
+        Data directory to index.  Defaults to *datadir*.
+
+    Other Parameters
+    ================
+    cachefile : str, default=None
+        Where to save the scan.  Defaults to 'catalog.json' in *cachedir*.
+        Set to False to never read or write a cache file.
 
     Examples
     ========
-    Calculate table for LFM-MIX, event 1 only, high-latitude stations only:
+    Find the stations with observations and SWMF results for event 2, then
+    get the path to the SWMF file for one of them:
 
-    >>> table = mmt.build_table('2_LFM-MIX', event_set=[1], mag_set='hi')
+    >>> cat = mmt.Catalog()
+    >>> cat.stations(2, '9_SWMF')
+    >>> cat.get('dBdt', 2, '9_SWMF', 'YKC')
 
-    Calculate table for SWMF, event 1 only, low-latitude stations only,
-    then print out values to screen:
+    '''
 
-    >>> table = mmt.build_table('9_SWMF', event_set=[1], mag_set='lo')
-    >>> print(table)
+    def __init__(self, path=None, cachefile=None):
+        self.path = datadir if path is None else path
+        if cachefile is None:
+            cachefile = os.path.join(cachedir, 'catalog.json')
+        self.cachefile = cachefile
 
-    199 hits, 4 misses, 6 false positives, 7 true negatives.
+        # Use the cached scan if the directory tree has not changed:
+        if not (self.cachefile and self._load()):
+            self.scan()
 
-    '''
+    def __len__(self):
+        return len(self.files)
 
-    from validator import BinaryEventTable
+    def __iter__(self):
+        return iter(sorted(self.files))
 
-    if not modthresh:
-        modthresh = thresh
+    def __contains__(self, key):
+        return key in self.files
 
-    # Handle mag set:
-    if mag_set == 'all':
-        mag_set = allmag
-    elif 'hi' in mag_set:
-        mag_set = hilat
-    elif 'lo' in mag_set:
-        mag_set = lolat
-    elif type(mag_set) is str:
-        mag_set = [mag_set]
+    def __repr__(self):
+        return f'Catalog of {len(self)} files in {self.path}'
 
-    # Handle events:
-    if event_set == 'all':
-        event_set = [1, 2, 3, 4, 7, 8]
-    elif type(event_set) == int:
-        event_set = [event_set]
+    def _dirmtimes(self):
+        '''Return the modification times of all cataloged directories.'''
+        mtimes = {}
+        for d in self.dirmtimes:
+            try:
+                mtimes[d] = os.stat(os.path.join(self.path, d)).st_mtime_ns
+            except OSError:
+                mtimes[d] = None
+        return mtimes
 
-    # Convert window from minutes to seconds:
-    window *= 60
+    def _load(self):
+        '''
+        Load the cached scan, returning False if there is none or if it is
+        out of date.
+        '''
 
-    for ev in event_set:
-        # Keep track of what magnetometers we used to build the table:
-        used_mags = []
+        try:
+            with open(self.cachefile, 'r') as f:
+                cache = json.load(f)
+        except (OSError, ValueError):
+            return False
 
-        # "Header" for debug prints:
-        if debug:
-            print(f"WORKING ON EVENT {ev}\n-------------------")
+        if cache.get('path') != os.path.abspath(self.path) or \
+           'headers' not in cache:
+            return False
 
-        for mag in mag_set:
-            # Build path to model data
-            f_mod = datadir + f'/dBdt/Event{ev}/{model}/{mag.upper()}' + \
-                f'_{model}_Event{ev}.txt'
+        self.dirmtimes = cache['dirmtimes']
+        if self._dirmtimes() != self.dirmtimes:
+            return False
 
-            # Build path to obs data
-            f_obs = datadir+f'/dBdt/Event{ev}/Observations/{mag.lower()}' \
-                + f'_OBS_{tlims[ev][0]:%Y%m%d}.txt'
+        self.files, self.dates = {}, {}
+        for relpath, date in cache['files']:
+            key = tuple(_parse_datapath(relpath)[:4])
+            self.files[key], self.dates[key] = relpath, date
+        self.headers = cache['headers']
 
-            if debug:
-                print(f'Looking for files:\n\t{f_mod}\n\t{f_obs}')
+        return True
 
-            if not os.path.exists(f_obs) or not os.path.exists(f_mod):
-                if verbose:
-                    print(f"Warning: magnetometer {mag} not found")
+    def scan(self):
+        '''
+        Walk the data directory and (re)build the catalog, saving it to
+        *cachefile*.
+        '''
+
+        self.files, self.dates, self.dirmtimes = {}, {}, {}
+        self.headers = {}
+
+        for root, dirs, fnames in os.walk(self.path):
+            reldir = os.path.relpath(root, self.path)
+
+            # Skip hidden directories (caches, stores, etc.):
+            dirs[:] = sorted(d for d in dirs if not d.startswith('.'))
+            self.dirmtimes[reldir] = os.stat(root).st_mtime_ns
+
+            # Data files live at least two levels down (quantity/event):
+            if reldir.count(os.sep) < 1:
                 continue
 
-            used_mags.append(mag)
+            for f in fnames:
+                if not f.endswith('.txt'):
+                    continue
+                relpath = os.path.normpath(os.path.join(reldir, f))
+                quantity, event, source, station, date = \
+                    _parse_datapath(relpath)
+                key = (quantity, event, source, station)
+                self.files[key], self.dates[key] = relpath, date
+                self.header(os.path.join(self.path, relpath))
 
-            # Open files
-            mod = read_ccmcfile(f_mod)
-            obs = read_ccmcfile(f_obs)
+        # Saving is only an optimization; keep the scan in memory if the
+        # cache file cannot be written:
+        if self.cachefile:
+            try:
+                os.makedirs(os.path.dirname(self.cachefile), exist_ok=True)
+                with open(self.cachefile + '.tmp', 'w') as f:
+                    json.dump({'path': os.path.abspath(self.path),
+                               'dirmtimes': self.dirmtimes,
+                               'files': [[self.files[k], self.dates[k]]
+                                         for k in sorted(self.files)],
+                               'headers': self.headers}, f)
+                os.replace(self.cachefile + '.tmp', self.cachefile)
+            except OSError:
+                with contextlib.suppress(OSError):
+                    os.remove(self.cachefile + '.tmp')
 
-            # Compute table, add to existing hits/misses/etc.
-            if 'table' not in locals():
-                table = BinaryEventTable(obs['time'], obs['dbh'],
-                                         mod['time'], mod['dbh'],
-                                         thresh, window, trange=tlims[ev],
-                                         modelcutoff=modthresh)
-            else:
-                table += BinaryEventTable(obs['time'], obs['dbh'],
-                                          mod['time'], mod['dbh'],
-                                          thresh, window, trange=tlims[ev],
-                                          modelcutoff=modthresh)
+    def get(self, quantity, event, source, station):
+        '''
+        Return the full path to the file for the given quantity, event,
+        source (model name or 'OBS'), and station, or None if there is no
+        such file.
+        '''
 
-        # Print off mags used in comparison
-        if debug:
-            print(f'Event {ev} used {len(used_mags)}:')
-            for m in used_mags:
-                print(f'\t{m}')
+        source = 'OBS' if source.upper() == 'OBS' else source
+        relpath = self.files.get((quantity, event, source, station.upper()))
+        _count('catalog', lookups=1)
 
-    return table
+        return None if relpath is None else os.path.join(self.path, relpath)
+
+    def header(self, filename):
+        '''
+        Return the header of *filename* (see `sniff_header`), sniffing it
+        only if it has not been seen before or has changed since.
+        '''
+
+        stat = os.stat(filename)
+        relpath = os.path.relpath(filename, self.path)
+        header = self.headers.get(relpath)
+        if header is None or header['mtime'] != stat.st_mtime_ns or \
+           header['size'] != stat.st_size:
+            header = sniff_header(filename)
+            header.update(mtime=stat.st_mtime_ns, size=stat.st_size)
+            self.headers[relpath] = header
+
+        return header
+
+    def find(self, quantity=None, event=None, source=None, station=None):
+        '''
+        Return a sorted list of all (quantity, event, source, station) keys
+        that match the given criteria; criteria left as None match all.
+        '''
+
+        if station is not None:
+            station = station.upper()
+        if source is not None and source.upper() == 'OBS':
+            source = 'OBS'
+
+        crit = (quantity, event, source, station)
+        return [k for k in sorted(self.files)
+                if all(c is None or c == x for c, x in zip(crit, k))]
+
+    def stations(self, event, source, quantity='dBdt'):
+        '''
+        Return a sorted list of stations that have both observations and
+        output from model *source* for event number *event*.
+        '''
+
+        obs = set(k[3] for k in self.find(quantity, event, 'OBS'))
+        mod = set(k[3] for k in self.find(quantity, event, source))
+
+        return sorted(obs & mod)
+
+
+def get_catalog():
+    '''
+    Return the `Catalog` of *datadir*, created on first use and rescanned
+    whenever the directory tree changes.
+    '''
+
+    global _catalog
+
+    with _stage('catalog') as counts:
+        if _catalog is None or _catalog.path != datadir or \
+           _catalog._dirmtimes() != _catalog.dirmtimes:
+            _catalog = Catalog()
+            counts.update(scans=1)
+
+    return _catalog
+
+
+def build_store(quantities=('dBdt', 'deltaB'), dtype=np.float64):
+    '''
+    Pack every data file under *datadir* into a single columnar store in
+    *storedir*: one memory-mappable .npy file per column ('time', 'n', 'e',
+    'z', and 'h') plus 'index.json', which maps each series to its offset
+    and length.  Series are then read with `load`.  Returns the number of
+    series stored, or 0 (with a warning) if the store cannot be written.
+
+    The store is not checked against the text files when loaded; rebuild it
+    whenever the data files change.
+
+    Other Parameters
+    ================
+    quantities : list of str, default=('dBdt', 'deltaB')
+        Which data types to include in the store.
+    dtype : numpy dtype, default=numpy.float64
+        Data type of the stored values, e.g., `numpy.float32` to halve the
+        size of the store (see `read_ccmcfile`).
+
+    '''
+
+    cat = get_catalog()
+
+    # Read each series (in sorted order, so that the layout is
+    # reproducible), noting where it lands in the columns:
+    index, columns, offset = {}, {c: [] for c in 'tnezh'}, 0
+    for key in cat:
+        quantity, event, source, station = key
+        if quantity not in quantities:
+            continue
+        recs = _read_records(cat.get(*key), cache=use_cache)
+        names = recs.dtype.names
+
+        index[f'{quantity}/{event}/{source}/{station}'] = \
+            [offset, recs.size, names[1][:-1]]
+        offset += recs.size
+
+        columns['t'].append(recs['time'])
+        for c, v in zip('nez', names[1:]):
+            columns[c].append(recs[v].astype(dtype))
+        columns['h'].append(np.sqrt(recs[names[1]]**2 +
+                                    recs[names[2]]**2).astype(dtype))
+
+    # Write columns and index to temporary files, then move them all into
+    # place.  If the store cannot be written, any existing one is kept.
+    files = {os.path.join(storedir, 'time.npy' if c == 't' else f'{c}.npy'):
+             np.concatenate(parts) if parts else np.zeros(0, dtype)
+             for c, parts in columns.items()}
+    files[os.path.join(storedir, 'index.json')] = \
+        {'version': _parser_version, 'series': index}
+    try:
+        os.makedirs(storedir, exist_ok=True)
+        for fname, contents in files.items():
+            with open(fname + '.tmp', 'wb') as f:
+                if isinstance(contents, dict):
+                    f.write(json.dumps(contents).encode())
+                else:
+                    np.save(f, contents)
+        for fname in files:
+            os.replace(fname + '.tmp', fname)
+    except OSError as err:
+        for fname in files:
+            with contextlib.suppress(OSError):
+                os.remove(fname + '.tmp')
+        print(f"Warning: could not write data store to {storedir}: {err}",
+              file=sys.stderr)
+        return 0
+
+    # Drop any previously opened store:
+    _store.clear()
+
+    return len(index)
+
+
+def load(quantity, event, source, station):
+    '''
+    Load a single series from the store created by `build_store`.
+
+    Results are returned as a dictionary in the same form as
+    `read_ccmcfile`, except that missing values are NaN instead of
+    masked.  All arrays are read-only, zero-copy slices of the
+    memory-mapped store.
+
+    Parameters
+    ==========
+    quantity : str
+        Either 'dBdt' or 'deltaB'.
+    event : int
+        Event number, e.g., 1.
+    source : str
+        Model name as in *models* (e.g., '9_SWMF') or 'OBS' for
+        observations.
+    station : str
+        Three-letter magnetometer station code, e.g., 'YKC'.
+
+    Examples
+    ========
+    >>> mmt.build_store()
+    >>> obs = mmt.load('dBdt', 1, 'OBS', 'YKC')
+
+    '''
+
+    # Open store on first use:
+    if not _store:
+        with open(os.path.join(storedir, 'index.json'), 'r') as f:
+            index = json.load(f)
+        if index['version'] != _parser_version:
+            raise ValueError('Data store is out of date; rerun build_store()')
+        _store['index'] = index['series']
+        for c in ('time', 'n', 'e', 'z', 'h'):
+            _store[c] = np.load(os.path.join(storedir, f'{c}.npy'),
+                                mmap_mode='r')
+
+    source = 'OBS' if source.upper() == 'OBS' else source
+    key = f'{quantity}/{event}/{source}/{station.upper()}'
+    offset, length, prefix = _store['index'][key]
+    loc = slice(offset, offset + length)
+
+    data = {'time': _store['time'][loc]}
+    for c in 'nezh':
+        data[prefix + c] = _store[c][loc]
+
+    return data
+
+
+def _sliding_max(values, width, nwin, stride=1):
+    '''
+    Return the maxima (ignoring NaN) of *nwin* windows of *width*
+    consecutive elements along the last axis of *values*, one window
+    starting every *stride* elements.
+
+    Uses the van Herk/Gil-Werman method: running maxima forward and
+    backward within blocks of *width* elements give the maximum of any
+    window as the larger of two values, so the work is O(n) whatever the
+    window width.
+    '''
+
+    n = (nwin - 1) * stride + width if nwin else 0
+    values = np.asarray(values)[..., :n]
+    if values.shape[-1] < n:
+        raise ValueError(f'{nwin} windows need {n} values, ' +
+                         f'not {values.shape[-1]}')
+
+    # Pad to whole blocks with a value that never wins:
+    nblock = -(-n // width)
+    padded = np.full(values.shape[:-1] + (nblock * width,), np.nan,
+                     dtype=values.dtype)
+    padded[..., :n] = values
+    blocks = padded.reshape(values.shape[:-1] + (nblock, width))
+
+    ahead = np.fmax.accumulate(blocks, axis=-1).reshape(padded.shape)
+    behind = np.fmax.accumulate(blocks[..., ::-1], axis=-1)[..., ::-1]
+    behind = behind.reshape(padded.shape)
+
+    loc = np.arange(nwin) * stride
+    return np.fmax(behind[..., loc], ahead[..., loc + width - 1])
+
+
+def window_max(time, values, start, window, nwin, stride=None):
+    '''
+    Find the maximum of *values* within each of *nwin* consecutive,
+    non-overlapping windows of *window* seconds starting at time *start*.
+    Each window includes its start time but not its end time.
+
+    Masked and NaN values are ignored; windows with no valid values are
+    set to NaN; floating point *values* keep their precision.  The work is
+    done with vectorized `datetime64` arithmetic and a single
+    `numpy.maximum.reduceat` call.
+
+    With *stride*, windows overlap (or leave gaps): window *i* starts
+    *i* x *stride* seconds after *start*.  The data are first binned into
+    non-overlapping bins of the greatest common divisor of *window* and
+    *stride* and then passed through a linear-time sliding maximum, so the
+    cost does not grow with the overlap.
+
+    Parameters
+    ==========
+    time : array of datetimes or datetime64
+        Time of each value.
+    values : array or masked array
+        Data values to bin.
+    start : datetime or datetime64
+        Start time of the first window.
+    window : int
+        Window size in seconds.
+    nwin : int
+        Number of windows.
+
+    Other Parameters
+    ================
+    stride : int, default=None
+        Time between the starts of consecutive windows in seconds.
+        Defaults to *window*.
+
+    Examples
+    ========
+    Maxima over the next 20 minutes, issued every minute:
+
+    >>> maxes = mmt.window_max(time, values, start, 20*60, 1440, stride=60)
+
+    '''
+
+    if stride and int(stride) != int(window):
+        window, stride = int(window), int(stride)
+        base = int(np.gcd(window, stride))
+        nbin = ((nwin - 1) * stride + window) // base if nwin else 0
+        binned = window_max(time, values, start, base, nbin)
+        with _stage('slide') as counts:
+            maxes = _sliding_max(binned, window // base, nwin,
+                                 stride // base)
+            counts.update(windows=nwin)
+        return maxes
+
+    with _stage('bin') as counts:
+        time = np.asarray(time, dtype='datetime64[s]')
+        vals = np.ma.filled(np.ma.masked_invalid(values), -np.inf)
+        if vals.dtype.kind != 'f':
+            vals = vals.astype(float)
+
+        # Ensure time is sorted:
+        if np.any(time[1:] < time[:-1]):
+            order = np.argsort(time, kind='stable')
+            time, vals = time[order], vals[order]
+
+        # Find where each window starts in the data.  Drop data after the
+        # last window (reduceat runs the final window to the end of the
+        # array), then pad with a value that never wins so empty windows
+        # have a valid index:
+        edges = np.datetime64(start, 's') + \
+            np.arange(nwin + 1) * np.timedelta64(int(window), 's')
+        loc = np.searchsorted(time, edges)
+        vals = np.append(vals[:loc[-1]], vals.dtype.type(-np.inf))
+
+        maxes = np.maximum.reduceat(vals, loc[:-1]) if nwin \
+            else np.zeros(0, vals.dtype)
+        maxes[loc[:-1] == loc[1:]] = -np.inf
+        maxes[np.isneginf(maxes)] = np.nan
+        counts.update(rows=time.size, windows=nwin)
+
+    return maxes
+
+
+def stream_window_max(blocks, start, window, nwin, var=None):
+    '''
+    Find the maximum of a time series within each of *nwin* windows, as
+    `window_max` does, but consume the series as an iterable of *blocks*
+    (e.g., from `iter_ccmcfile`) so that it never has to be held in memory
+    at once.  Results are identical to `window_max` on the full series.
+
+    Parameters
+    ==========
+    blocks : iterable of dicts
+        Blocks of data, each with a 'time' entry and an entry for *var*.
+        Blocks may arrive in any order.
+    start : datetime or datetime64
+        Start time of the first window.
+    window : int
+        Window size in seconds.
+    nwin : int
+        Number of windows.
+
+    Other Parameters
+    ================
+    var : str, default=None
+        Name of the variable to bin.  Defaults to the "H" component ('dbh'
+        or 'bh').
+
+    Examples
+    ========
+    Bin a long observed record and a model run without reading either file
+    in full, then build a binary event table:
+
+    >>> start, nwin = mmt._windows(mmt.tlims[1], 20*60)
+    >>> obsmax = mmt.stream_window_max(mmt.iter_ccmcfile(f_obs), start,
+    ...                                20*60, nwin)
+    >>> modmax = mmt.stream_window_max(mmt.iter_ccmcfile(f_mod), start,
+    ...                                20*60, nwin)
+    >>> table = mmt.BinaryEventTable.from_maxima(obsmax, modmax, 0.3)
+
+    '''
+
+    start = np.datetime64(start, 's')
+    maxes = np.full(nwin, np.nan)
+
+    for block in blocks:
+        time = np.asarray(block['time'], dtype='datetime64[s]')
+        if var is None:
+            var = [v for v in block if v in ('dbh', 'bh')][0]
+        if not time.size:
+            continue
+
+        # Only visit the windows spanned by this block:
+        first, last = [int((t - start).astype(int) // window)
+                       for t in (time.min(), time.max())]
+        first, last = max(first, 0), min(last + 1, nwin)
+        if first >= last:
+            continue
+
+        part = window_max(time, block[var],
+                          start + np.timedelta64(first*int(window), 's'),
+                          window, last - first)
+        maxes[first:last] = np.fmax(maxes[first:last], part)
+
+    return maxes
+
+
+def _ratio(num, den):
+    '''Return num/den, or NaN where den is zero; works on arrays, too.'''
+    num, den = np.asarray(num, dtype=float), np.asarray(den, dtype=float)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(den != 0, num / den, np.nan)[()]
+
+
+def _pod(c):
+    '''Hit rate, or probability of detection, from counts *c*.'''
+    return _ratio(c['hit'], c['hit'] + c['miss'])
+
+
+def _pofd(c):
+    '''False alarm rate, or probability of false detection, from *c*.'''
+    return _ratio(c['falseP'], c['falseP'] + c['trueN'])
+
+
+def _hss(counts):
+    '''Heidke skill score from *counts*.'''
+    a, b, c, d = [np.asarray(counts[k], dtype=float)
+                  for k in ('hit', 'falseP', 'miss', 'trueN')]
+    return _ratio(2.0 * (a*d - b*c), (a+c)*(c+d) + (a+b)*(b+d))
+
+
+def _bias(c):
+    '''Frequency bias (predicted over observed events) from counts *c*.'''
+    return _ratio(c['hit'] + c['falseP'], c['hit'] + c['miss'])
+
+
+def _floats(values):
+    '''Return *values* as an array, converted to float unless floating.'''
+    values = np.asarray(values)
+    return values if values.dtype.kind == 'f' else values.astype(float)
+
+
+def _cutoff(thresh, values):
+    '''
+    Return the threshold *thresh* at the precision of *values* if they
+    are floating point, so that, e.g., float32 data exactly at a threshold
+    compare as equal to it.
+    '''
+    values = np.asarray(values)
+    return np.asarray(thresh, values.dtype) if values.dtype.kind == 'f' \
+        else thresh
+
+
+def _windows(trange, window):
+    '''
+    Return the start time (as datetime64) and number of windows of *window*
+    seconds needed to cover the time range *trange*.
+    '''
+
+    start, end = [np.datetime64(t, 's') for t in trange]
+    return start, int(np.ceil((end - start).astype(int) / window))
+
+
+class BinaryEventTable(object):
+    '''
+    Create a binary event table (a 2x2 contingency table) by comparing an
+    observed and modeled time series, following Pulkkinen et al., 2013.
+
+    Both series are broken into fixed, non-overlapping windows of *window*
+    seconds.  Within each window, an event is observed if the observed
+    maximum meets or exceeds *threshold* and an event is predicted if the
+    model maximum meets or exceeds *modelcutoff*.  Windows are then counted
+    as hits, misses, false positives ("falseP"), or true negatives
+    ("trueN"); counts are accessed like a dictionary, e.g., `table['hit']`.
+
+    Tables can be added together to combine stations and events; to combine
+    many at once, use `BinaryEventTable.concatenate`.
+
+    Parameters
+    ==========
+    tObs, Obs : arrays
+        Observed times (datetimes or datetime64) and values.
+    tMod, Mod : arrays
+        Modeled times (datetimes or datetime64) and values.
+    threshold : float
+        Event threshold.
+    window : int
+        Window size in seconds.
+
+    Other Parameters
+    ================
+    trange : 2-element list of datetimes or datetime64, default=None
+        Time range to analyze.  Defaults to the period spanned by the data.
+    verbose : bool, default=False
+        Print the table to screen once created.
+    modelcutoff : float, default=None
+        Set a different event threshold for the model.  Defaults to
+        *threshold*.
+    stride : int, default=None
+        Time between the starts of consecutive windows in seconds, e.g.,
+        60 for a forecast of the next *window* seconds issued every
+        minute.  Defaults to *window* (non-overlapping windows).
+    keep_raw : bool, default=True
+        Keep the input series as attributes.  If False, only the window
+        maxima are kept, which saves memory when combining many tables.
+
+    Attributes
+    ==========
+    tObs, Obs, tMod, Mod : arrays or None
+        The input series; None if *keep_raw* is False.
+    time : datetime64 array
+        Center time of each window.
+    obsmax, modmax : arrays
+        Maximum of the observed and modeled values in each window; NaN for
+        windows without valid data.
+    bool : boolean array
+        True for windows where the model predicts an event.
+
+    '''
+
+    __slots__ = ('tObs', 'Obs', 'tMod', 'Mod', 'threshold', 'window',
+                 'stride', 'modelcutoff', 'time', 'obsmax', 'modmax', 'bool',
+                 '_counts')
+
+    def __init__(self, tObs, Obs, tMod, Mod, threshold, window, trange=None,
+                 verbose=False, modelcutoff=None, stride=None, keep_raw=True):
+
+        # Save inputs:
+        self.tObs, self.Obs, self.tMod, self.Mod = (tObs, Obs, tMod, Mod) \
+            if keep_raw else (None,) * 4
+        self.threshold, self.window = threshold, window
+        self.stride = stride if stride else window
+        self.modelcutoff = modelcutoff if modelcutoff else threshold
+
+        # Set time range and number of windows.  Without a set range,
+        # ensure that the last data point falls into the final window.
+        if trange is None:
+            start = min(np.datetime64(tObs[0], 's'),
+                        np.datetime64(tMod[0], 's'))
+            end = max(np.datetime64(tObs[-1], 's'),
+                      np.datetime64(tMod[-1], 's'))
+            nwin = int((end - start).astype(int) // self.stride) + 1
+        else:
+            start, nwin = _windows(trange, self.stride)
+
+        # Window centers:
+        self.time = _centers(start, window, nwin, self.stride)
+
+        # Get maxima in each window:
+        self.obsmax = window_max(tObs, Obs, start, window, nwin, self.stride)
+        self.modmax = window_max(tMod, Mod, start, window, nwin, self.stride)
+
+        # Count hits, misses, etc.
+        self._count()
+
+        if verbose:
+            print(self)
+
+    @classmethod
+    def from_maxima(cls, obsmax, modmax, threshold, modelcutoff=None,
+                    time=None, window=None, stride=None):
+        '''
+        Create a table directly from window maxima, e.g., from
+        `build_binned` or an `EnsembleCube`, instead of raw time series.
+        The maxima double as the "raw" series (*Obs* and *Mod*) and *time*,
+        if given, as their times.
+        '''
+
+        self = cls.__new__(cls)
+        self.threshold, self.window = threshold, window
+        self.stride = stride if stride else window
+        self.modelcutoff = modelcutoff if modelcutoff else threshold
+
+        self.obsmax, self.modmax = _floats(obsmax), _floats(modmax)
+        self.time = np.zeros(self.obsmax.size, dtype='datetime64[s]') \
+            if time is None else np.asarray(time, dtype='datetime64[s]')
+        self.tObs, self.Obs = self.time, np.ma.asarray(self.obsmax)
+        self.tMod, self.Mod = self.time, np.ma.asarray(self.modmax)
+
+        self._count()
+
+        return self
+
+    def _count(self):
+        '''Classify each window and count hits, misses, etc.'''
+
+        with _stage('table') as counts:
+            obs = self.obsmax >= _cutoff(self.threshold, self.obsmax)
+            self.bool = self.modmax >= _cutoff(self.modelcutoff, self.modmax)
+
+            self._counts = {'hit': int(np.sum(obs & self.bool)),
+                            'miss': int(np.sum(obs & ~self.bool)),
+                            'falseP': int(np.sum(~obs & self.bool)),
+                            'trueN': int(np.sum(~obs & ~self.bool))}
+            counts.update(tables=1, windows=obs.size)
+
+    def __getitem__(self, key):
+        return self._counts[key]
+
+    def keys(self):
+        return self._counts.keys()
+
+    def __str__(self):
+        return f"{self['hit']} hits, {self['miss']} misses, " + \
+            f"{self['falseP']} false positives, {self['trueN']} " + \
+            "true negatives."
+
+    def __repr__(self):
+        return f'BinaryEventTable: {self}'
+
+    def __add__(self, other):
+        new = copy.copy(self)
+        new += other
+        return new
+
+    def __iadd__(self, other):
+        merged = self.concatenate([self, other])
+        for x in self.__slots__:
+            setattr(self, x, getattr(merged, x))
+
+        return self
+
+    @classmethod
+    def concatenate(cls, tables):
+        '''
+        Combine *tables* (e.g., one per station and event) into a single
+        table.  Each array is joined once, rather than once per table as
+        with repeated `+=`.  The raw series are kept only if all tables
+        have them.
+        '''
+
+        tables = list(tables)
+        first = tables[0]
+        for t in tables[1:]:
+            if (first.threshold, first.modelcutoff, first.window,
+                    first.stride) != \
+               (t.threshold, t.modelcutoff, t.window, t.stride):
+                raise ValueError('Cannot combine tables with different ' +
+                                 'thresholds or windows')
+
+        self = cls.__new__(cls)
+        self.threshold, self.window = first.threshold, first.window
+        self.stride = first.stride
+        self.modelcutoff = first.modelcutoff
+
+        # Stack windows and raw data:
+        with _stage('merge') as counts:
+            for x in ('time', 'obsmax', 'modmax', 'bool'):
+                setattr(self, x, np.concatenate([getattr(t, x)
+                                                 for t in tables]))
+            raw = all(t.Obs is not None and t.Mod is not None
+                      for t in tables)
+            for x in ('tObs', 'Obs', 'tMod', 'Mod'):
+                join = np.ma.concatenate if x[0] != 't' else np.concatenate
+                setattr(self, x, join([getattr(t, x) for t in tables])
+                        if raw else None)
+            counts.update(merges=len(tables) - 1,
+                          windows=self.obsmax.size - first.obsmax.size)
+
+        # Sum counts:
+        self._counts = {k: sum(t[k] for t in tables) for k in first.keys()}
+
+        return self
+
+    def calc_HR(self):
+        '''Hit rate, or probability of detection (PoD).'''
+        return _pod(self)
+
+    def calc_FARate(self):
+        '''False alarm rate, or probability of false detection (PoFD).'''
+        return _pofd(self)
+
+    def calc_heidke(self):
+        '''Heidke skill score (HSS).'''
+        return _hss(self)
+
+    def calc_bias(self):
+        '''Frequency bias: number of predicted over observed events.'''
+        return _bias(self)
+
+
+def _parse_sets(event_set, mag_set):
+    '''
+    Turn the *event_set* and *mag_set* arguments of `build_table` into
+    lists of event numbers and station names.
+    '''
+
+    # Handle mag set:
+    if mag_set == 'all':
+        mag_set = allmag
+    elif 'hi' in mag_set:
+        mag_set = hilat
+    elif 'lo' in mag_set:
+        mag_set = lolat
+    elif type(mag_set) is str:
+        mag_set = [mag_set]
+
+    # Handle events:
+    if event_set == 'all':
+        event_set = [1, 2, 3, 4, 7, 8]
+    elif type(event_set) == int:
+        event_set = [event_set]
+
+    return event_set, mag_set
+
+
+def union_mags(mag_sets):
+    '''
+    Return the sorted, upper-case list of stations in any of the mag sets
+    in *mag_sets* (each as accepted by `build_table`), e.g., to build one
+    `EnsembleCube` from which each group is then selected.
+
+    Examples
+    ========
+    >>> mmt.union_mags(['hi', 'lo', 'pbq'])
+
+    '''
+
+    return sorted(set(m.upper() for group in mag_sets
+                      for m in _parse_sets('all', group)[1]))
+
+
+def _init_worker(config):
+    '''Copy the parent's reader settings into a pool worker process.'''
+    globals().update(config)
+
+
+def _pool_map(func, tasks, jobs=1):
+    '''
+    Call *func* with each tuple of arguments in *tasks* and return the
+    results as a list.  If *jobs* is not 1, calls are spread over a pool of
+    *jobs* worker processes (all CPUs if *jobs* is None or less than 1).
+    Results are always returned in task order, so they can be merged
+    exactly as in the serial case.
+    '''
+
+    tasks = list(tasks)
+    if jobs == 1 or len(tasks) < 2:
+        return [func(*t) for t in tasks]
+
+    # Only import the process machinery when it is used:
+    from concurrent.futures import ProcessPoolExecutor
+
+    if jobs is None or jobs < 1:
+        jobs = os.cpu_count()
+    config = {'use_cache': use_cache, 'cachedir': cachedir,
+              'memo_maxbytes': memo_maxbytes}
+    with ProcessPoolExecutor(min(jobs, len(tasks)), initializer=_init_worker,
+                             initargs=(config,)) as pool:
+        return list(pool.map(func, *zip(*tasks)))
+
+
+def _station_table(f_obs, f_mod, thresh, window, trange, modthresh,
+                   legacy=False, keep_raw=True, stride=None):
+    '''
+    Build the binary event table for one pair of observed and modeled
+    dB/dt files; see `build_table`.
+    '''
+
+    mod = read_ccmcfile(f_mod)
+    obs = read_ccmcfile(f_obs)
+
+    if not legacy:
+        return BinaryEventTable(obs['time'], obs['dbh'], mod['time'],
+                                mod['dbh'], thresh, window, trange=trange,
+                                modelcutoff=modthresh, stride=stride,
+                                keep_raw=keep_raw)
+
+    # The legacy tables work with datetimes only:
+    from validator import BinaryEventTable as Table
+    for data in (obs, mod):
+        data['time'] = data['time'].astype(object)
+
+    return Table(obs['time'], obs['dbh'], mod['time'], mod['dbh'],
+                 thresh, window, trange=trange.astype(object),
+                 modelcutoff=modthresh)
+
+
+def build_table(model,  event_set='all', mag_set='all', thresh=0.3,
+                window=20, debug=False, verbose=True, modthresh=None,
+                legacy=False, jobs=1, keep_raw=False, stride=None):
+    '''
+    Create a binary event table for *model* (must be member of *models* list)
+    that includes all magnetometers included in *mag_set* (can be "all", "hi",
+    or "lo") for all events listed in *event_set* and using a certain
+    threshold, *thresh*.
+
+    Parameters
+    ==========
+    model:str
+       What model to use when building the table.  See *models* list for
+       options.
+
+    Other Parameters
+    ================
+    mag_set : str or list
+        Set which group of magnetometers to use. Can be a list of 3-letter
+        magnetometer station name codes or a string indicating what group to
+        use, e.g., 'hi', 'lo', or 'all' for high latitude, mid-latitude,
+        or both.
+
+    event_set : list or 'all'
+        List of event numbers to include, e.g., [1,2,8], defaults to 'all'.
+        Available events are [1,2,3,4,7,8] following Pulkkinen et al., 2013.
+
+    thresh : float, default=0.3
+        Set the event threshold value; defaults to 0.3.
+
+    modthresh : float
+        Set the threshold for the model to be different then the observation.
+        This is for experimental purposes only.
+
+    window : int, default=20
+        Set the interval window in minutes; defaults to 20.
+
+    stride : int, default=None
+        Start a window every *stride* minutes, e.g., 1 for overlapping
+        windows issued every minute.  Defaults to *window*.  Not
+        available for legacy tables.
+
+    debug : Boolean, default=False
+        Print extra debug info to screen.
+
+    legacy : Boolean, default=False
+        Build the table with `validator.BinaryEventTable` instead of this
+        module's `BinaryEventTable`.
+
+    jobs : int, default=1
+        Number of worker processes used to read and bin the data files; use
+        None or 0 for all CPUs.  Results are identical for any value.
+
+    keep_raw : Boolean, default=False
+        Keep the raw observed and modeled series (*tObs*, *Obs*, *tMod*,
+        *Mod*) in the table, e.g., for plotting.  By default, only the
+        window maxima are kept.  Legacy tables always keep them.
+
+    Examples
+    ========
+    Calculate table for LFM-MIX, event 1 only, high-latitude stations only:
+
+    >>> table = mmt.build_table('2_LFM-MIX', event_set=[1], mag_set='hi')
+
+    Calculate table for SWMF, event 1 only, low-latitude stations only,
+    then print out values to screen:
+
+    >>> table = mmt.build_table('9_SWMF', event_set=[1], mag_set='lo')
+    >>> print(table)
+
+    199 hits, 4 misses, 6 false positives, 7 true negatives.
+
+    '''
+
+    if not modthresh:
+        modthresh = thresh
+
+    # Handle mag and event sets:
+    event_set, mag_set = _parse_sets(event_set, mag_set)
+
+    if legacy and stride and stride != window:
+        raise ValueError('Legacy tables only support non-overlapping ' +
+                         'windows')
+
+    # Convert window and stride from minutes to seconds:
+    window, stride = window * 60, (stride if stride else window) * 60
+
+    # Catalog of available data files:
+    cat = get_catalog()
+
+    # Collect the pairs of files to compare:
+    tasks = []
+    for ev in event_set:
+        # Keep track of what magnetometers we used to build the table:
+        used_mags = []
+
+        # "Header" for debug prints:
+        if debug:
+            print(f"WORKING ON EVENT {ev}\n-------------------")
+
+        for mag in mag_set:
+            # Look up paths to model and obs data:
+            f_mod = cat.get('dBdt', ev, model, mag)
+            f_obs = cat.get('dBdt', ev, 'OBS', mag)
+
+            if debug:
+                print(f'Looking for files:\n\t{f_mod}\n\t{f_obs}')
+
+            if f_obs is None or f_mod is None:
+                if verbose:
+                    print(f"Warning: magnetometer {mag} not found")
+                continue
+
+            used_mags.append(mag)
+            tasks.append((f_obs, f_mod, thresh, window, tlims[ev],
+                          modthresh, legacy, keep_raw, stride))
+
+        # Print off mags used in comparison
+        if debug:
+            print(f'Event {ev} used {len(used_mags)}:')
+            for m in used_mags:
+                print(f'\t{m}')
+
+    # Compute tables, add up hits/misses/etc. in order:
+    tables = _pool_map(_station_table, tasks, jobs)
+    if not legacy:
+        return BinaryEventTable.concatenate(tables)
+
+    table = tables[0]
+    for t in tables[1:]:
+        table += t
+
+    return table
+
+
+def _bin_file(filename, start, window, nwin, dtype=None, stride=None):
+    '''
+    Read the dB/dt file *filename* and return the maximum of its H
+    component in each of *nwin* windows (see `window_max`).  *dtype* is
+    passed to `read_ccmcfile`.
+    '''
+
+    data = read_ccmcfile(filename, dtype=dtype)
+    return window_max(data['time'], data['dbh'], start, window, nwin,
+                      stride=stride)
+
+
+def _centers(start, window, nwin, stride=None):
+    '''
+    Return the center times of *nwin* windows of *window* seconds, one
+    starting every *stride* (default: *window*) seconds.
+    '''
+    return np.datetime64(start, 's') + np.timedelta64(int(window)//2, 's') + \
+        np.arange(nwin) * np.timedelta64(int(stride or window), 's')
+
+
+def build_binned(model, event_set='all', mag_set='all', window=20,
+                 verbose=False, jobs=1, stride=None):
+    '''
+    Bin the observed and modeled dB/dt for *model* into windows once and
+    return the window maxima, so that any number of thresholds can be
+    evaluated afterwards with `contingency_sweep` without rereading or
+    rebinning the data.  Windows match those used by `build_table`.
+
+    Results are returned as a dictionary of arrays, one entry per window:
+    'obsmax' and 'modmax' (window maxima, NaN if no valid data), 'time'
+    (window center), 'event' (event number), and 'station' (station code).
+
+    Parameters
+    ==========
+    model : str
+       What model to use.  See *models* list for options.
+
+    Other Parameters
+    ================
+    event_set : list or 'all'
+        List of event numbers to include; see `build_table`.
+    mag_set : str or list
+        Set of magnetometers to include; see `build_table`.
+    window : int, default=20
+        Set the interval window in minutes; defaults to 20.
+    stride : int, default=None
+        Start a window every *stride* minutes, e.g., 1 for overlapping
+        windows issued every minute.  Defaults to *window*.
+    verbose : Boolean, default=False
+        Print a warning for each station that has no data.
+    jobs : int, default=1
+        Number of worker processes used to read and bin the data files; use
+        None or 0 for all CPUs.  Results are identical for any value.
+
+    Examples
+    ========
+    >>> binned = mmt.build_binned('9_SWMF', event_set=[1, 2])
+    >>> sweep = mmt.contingency_sweep(binned, 0.3, [0.1, 0.2, 0.3])
+    >>> sweep['hss']
+
+    '''
+
+    event_set, mag_set = _parse_sets(event_set, mag_set)
+    cat = get_catalog()
+    window, stride = window * 60, (stride if stride else window) * 60
+
+    parts = {x: [] for x in ('time', 'event', 'station')}
+    tasks = []
+    for ev in event_set:
+        start, nwin = _windows(tlims[ev], stride)
+        for mag in mag_set:
+            f_mod = cat.get('dBdt', ev, model, mag)
+            f_obs = cat.get('dBdt', ev, 'OBS', mag)
+            if f_obs is None or f_mod is None:
+                if verbose:
+                    print(f"Warning: magnetometer {mag} not found")
+                continue
+
+            tasks += [(f_obs, start, window, nwin, None, stride),
+                      (f_mod, start, window, nwin, None, stride)]
+            parts['time'].append(_centers(start, window, nwin, stride))
+            parts['event'].append(np.full(nwin, ev))
+            parts['station'].append(np.full(nwin, mag.upper()))
+
+    # Observations and model alternate in the binned results:
+    maxima = _pool_map(_bin_file, tasks, jobs)
+    parts['obsmax'], parts['modmax'] = maxima[0::2], maxima[1::2]
+
+    binned = {}
+    for x, dtype in (('obsmax', float), ('modmax', float),
+                     ('time', 'datetime64[s]'), ('event', int),
+                     ('station', 'U3')):
+        binned[x] = np.concatenate(parts[x]) if parts[x] \
+            else np.zeros(0, dtype=dtype)
+
+    return binned
+
+
+def contingency_sweep(binned, obs_thresh, mod_threshes=None):
+    '''
+    Compute contingency counts and metrics from the window maxima in
+    *binned* (see `build_binned`) for many thresholds at once.
+
+    The observed and model thresholds are broadcast against each other, so
+    a scalar *obs_thresh* and an array of *mod_threshes* yields one curve;
+    use, e.g., `obs_thresh[:, None]` and `mod_threshes[None, :]` for a full
+    grid.
+
+    Results are returned as a dictionary of arrays with the broadcast shape
+    of the thresholds: counts 'hit', 'miss', 'falseP', and 'trueN' along
+    with metrics 'pod', 'pofd', 'hss', and 'bias'.
+
+    Parameters
+    ==========
+    binned : dict
+        Window maxima as returned by `build_binned`.
+    obs_thresh : float or array
+        Event threshold(s) for the observations.
+
+    Other Parameters
+    ================
+    mod_threshes : float or array, default=None
+        Event threshold(s) for the model.  Defaults to *obs_thresh*.
+
+    '''
+
+    if mod_threshes is None:
+        mod_threshes = obs_thresh
+
+    # Add a trailing axis for windows; compare all thresholds at once.
+    obs_thresh = np.asarray(obs_thresh, dtype=float)[..., None]
+    mod_threshes = np.asarray(mod_threshes, dtype=float)[..., None]
+    obs = binned['obsmax'] >= obs_thresh
+    mod = binned['modmax'] >= mod_threshes
+
+    sweep = {'hit': np.sum(obs & mod, axis=-1),
+             'miss': np.sum(obs & ~mod, axis=-1),
+             'falseP': np.sum(~obs & mod, axis=-1),
+             'trueN': np.sum(~obs & ~mod, axis=-1)}
+    sweep['pod'] = _pod(sweep)
+    sweep['pofd'] = _pofd(sweep)
+    sweep['hss'] = _hss(sweep)
+    sweep['bias'] = _bias(sweep)
+
+    return sweep
+
+
+def threshold_curve(binned, obs_thresh):
+    '''
+    Compute contingency counts and metrics from the window maxima in
+    *binned* (see `build_binned`) for every model threshold at once.
+
+    Counts only change where the model threshold passes one of the model
+    window maxima, so the curve is evaluated exactly at each distinct
+    maximum: the maxima are sorted once and hits and false positives
+    follow from cumulative sums, O(n log n) for n windows.  Windows
+    without valid model data never predict an event.
+
+    Results are returned as a dictionary of arrays, one entry per distinct
+    model maximum in descending order: 'modthresh' (the maximum), counts
+    'hit', 'miss', 'falseP', and 'trueN', and metrics 'pod', 'pofd', 'hss',
+    and 'bias'.  Every model threshold above the next entry's 'modthresh',
+    up to and including this one, gives these values.
+
+    Parameters
+    ==========
+    binned : dict
+        Window maxima as returned by `build_binned`.
+    obs_thresh : float
+        Event threshold for the observations.
+
+    Examples
+    ========
+    >>> curve = mmt.threshold_curve(mmt.build_binned('9_SWMF'), 0.3)
+    >>> plt.step(curve['modthresh'], curve['hss'], where='post')
+
+    '''
+
+    obsmax, modmax = _floats(binned['obsmax']), _floats(binned['modmax'])
+    obs = obsmax >= _cutoff(obs_thresh, obsmax)
+    valid = ~np.isnan(modmax)
+
+    # Sort model maxima, highest first, and count windows at or above each:
+    order = np.argsort(-modmax[valid], kind='stable')
+    mod, hit = modmax[valid][order], obs[valid][order]
+    hits, falsep = np.cumsum(hit), np.cumsum(~hit)
+
+    # Keep the last of each run of equal maxima (none if all are NaN):
+    last = np.flatnonzero(np.append(mod[1:] != mod[:-1], True))[:mod.size]
+
+    nobs = int(np.sum(obs))
+    curve = {'modthresh': mod[last], 'hit': hits[last],
+             'falseP': falsep[last]}
+    curve['miss'] = nobs - curve['hit']
+    curve['trueN'] = obs.size - nobs - curve['falseP']
+    curve['pod'] = _pod(curve)
+    curve['pofd'] = _pofd(curve)
+    curve['hss'] = _hss(curve)
+    curve['bias'] = _bias(curve)
+
+    return curve
+
+
+# Scores maximized by optimize_threshold for each metric:
+_objectives = {'bias': lambda c: -np.abs(1 - c['bias']),
+               'hss': lambda c: c['hss'],
+               'pod': lambda c: c['pod'],
+               'pss': lambda c: c['pod'] - c['pofd']}
+
+
+def optimize_threshold(binned, obs_thresh, metric='bias'):
+    '''
+    Find the model threshold that gives the best *metric* for the window
+    maxima in *binned* (see `build_binned`) with the observations at
+    *obs_thresh*.  The search is exact: every threshold at which any count
+    changes is considered (see `threshold_curve`).  Of equally good
+    thresholds, the highest is returned.
+
+    Results are returned as a dictionary: 'modthresh' (the optimal model
+    threshold), 'lower' (the next lower threshold at which counts change;
+    any threshold above it, up to 'modthresh', is equally good, -inf if
+    there is none), 'metric', and the counts and metrics at the optimum
+    (see `contingency_sweep`).
+
+    Parameters
+    ==========
+    binned : dict
+        Window maxima as returned by `build_binned`.
+    obs_thresh : float
+        Event threshold for the observations.
+
+    Other Parameters
+    ================
+    metric : str, default='bias'
+        What to optimize: 'bias' (closest to 1), 'hss' (Heidke skill
+        score), 'pod' (probability of detection; the highest threshold with
+        the best PoD), or 'pss' (Peirce skill score, PoD - PoFD, the
+        trade-off between detections and false alarms).
+
+    Examples
+    ========
+    >>> binned = mmt.build_binned('9_SWMF')
+    >>> mmt.optimize_threshold(binned, 0.3, metric='hss')['modthresh']
+
+    '''
+
+    if metric not in _objectives:
+        raise ValueError(f'Unknown metric {metric!r}; use one of ' +
+                         ', '.join(_objectives))
+
+    curve = threshold_curve(binned, obs_thresh)
+    score = _objectives[metric](curve)
+    if np.all(np.isnan(score)):
+        raise ValueError(f'No model threshold gives a valid {metric}')
+
+    # nanargmax returns the first, i.e., highest, of equal thresholds:
+    i = int(np.nanargmax(score))
+    best = {x: curve[x][i] for x in curve}
+    best['lower'] = curve['modthresh'][i+1] \
+        if i + 1 < curve['modthresh'].size else -np.inf
+    best['metric'] = metric
+
+    return best
+
+
+class MaxPyramid(object):
+    '''
+    Maxima of one or more series binned at a fixed base resolution, kept
+    as a sparse table so that the maxima of windows of any multiple of the
+    base length can be found without rereading or rebinning the data.
+
+    Level *k* of the table holds the maximum of the 2**k consecutive base
+    bins starting at each bin.  A window of *w* bins is covered by two,
+    possibly overlapping, blocks from the highest level with 2**k <= w, so
+    the maxima of *n* windows take two lookups and one `numpy.fmax` each,
+    O(n) regardless of window length.  Levels are built (in O(n_bins) each)
+    the first time they are needed.
+
+    Parameters
+    ==========
+    basemax : array, shape (..., n_bins)
+        Maximum of each series in each base bin, NaN for bins without
+        valid data, e.g., from `window_max`.  Leading axes index series.
+
+    Other Parameters
+    ================
+    base : int, default=60
+        Length of the base bins in seconds.
+
+    Attributes
+    ==========
+    levels : list of arrays
+        The levels built so far; `levels[0]` is *basemax*.
+    nbins : int
+        Number of base bins.
+
+    Examples
+    ========
+    >>> data = mmt.read_ccmcfile(filename)
+    >>> basemax = mmt.window_max(data['time'], data['dbh'], start, 60, 1440)
+    >>> pyramid = mmt.MaxPyramid(basemax)
+    >>> pyramid.maxima(20*60, 72)    # Same as window_max with 20 minutes.
+
+    '''
+
+    def __init__(self, basemax, base=60):
+        self.base = int(base)
+        self.levels = [_floats(basemax)]
+        self.nbins = self.levels[0].shape[-1]
+
+    def __repr__(self):
+        return f'MaxPyramid({self.nbins} bins of {self.base} s, ' + \
+            f'{len(self.levels)} levels)'
+
+    def level(self, k):
+        '''Return level *k*, building it and the ones below if needed.'''
+
+        with _stage('pyramid') as counts:
+            while len(self.levels) <= k:
+                prev, half = self.levels[-1], 2**(len(self.levels) - 1)
+                self.levels.append(np.fmax(prev[..., :-half],
+                                           prev[..., half:]))
+                counts.update(levels=1)
+
+        return self.levels[k]
+
+    def maxima(self, window, nwin, stride=None):
+        '''
+        Return the maxima in *nwin* consecutive, non-overlapping windows of
+        *window* seconds starting with the first base bin; the result has
+        shape (..., nwin).  Identical to binning the original data with
+        `window_max` using the same start time.  With *stride* (seconds,
+        a multiple of the base bins), windows start every *stride* seconds
+        instead.
+        '''
+
+        width, rem = divmod(int(window), self.base)
+        step, srem = divmod(int(stride or window), self.base)
+        if rem or srem or width < 1 or step < 1:
+            raise ValueError(f'Window ({window} s) and stride must be ' +
+                             f'multiples of the {self.base} s base bins')
+        if nwin and (nwin - 1) * step + width > self.nbins:
+            raise ValueError(f'{nwin} windows of {window} s run past the ' +
+                             f'end of the {self.nbins} base bins')
+
+        k = width.bit_length() - 1
+        table = self.level(k)
+        with _stage('pyramid') as counts:
+            loc = np.arange(nwin) * step
+            maxes = np.fmax(table[..., loc], table[..., loc + width - 2**k])
+            counts.update(windows=maxes.size)
+
+        return maxes
+
+
+def build_pyramid(model, event_set='all', mag_set='all', max_window=60,
+                  base=1, verbose=False, jobs=1, dtype=None):
+    '''
+    Bin the observed and modeled dB/dt for *model* into short base bins
+    once and keep them as `MaxPyramid` objects, from which the window
+    maxima for any window length (a multiple of *base*, up to *max_window*)
+    follow without touching the data files again; see `window_sweep`.
+
+    Results are returned as a dictionary: 'obs' and 'mod' (pyramids with
+    one row per event/station pair), 'event' and 'station' (the pair for
+    each row), 'base' and 'max_window' (in minutes).  The base bins of each
+    pair start at the beginning of its event (see *tlims*) and extend
+    *max_window* beyond its end, so every window matches `build_table`.
+
+    Parameters
+    ==========
+    model : str
+       What model to use.  See *models* list for options.
+
+    Other Parameters
+    ================
+    event_set : list or 'all'
+        List of event numbers to include; see `build_table`.
+    mag_set : str or list
+        Set of magnetometers to include; see `build_table`.
+    max_window : int, default=60
+        Longest window, in minutes, to be asked of the pyramids.
+    base : int, default=1
+        Length of the base bins in minutes.
+    verbose : Boolean, default=False
+        Print a warning for each station that has no data.
+    jobs : int, default=1
+        Number of worker processes used to read and bin the data files; use
+        None or 0 for all CPUs.  Results are identical for any value.
+    dtype : numpy dtype, default=numpy.float64
+        Precision of the data and maxima (see `read_ccmcfile`).
+
+    '''
+
+    event_set, mag_set = _parse_sets(event_set, mag_set)
+    cat = get_catalog()
+
+    # One width for all pairs so that they stack; bins beyond the end of a
+    # shorter event hold its data, if any, just as build_table would see.
+    nbins = max(_windows(tlims[ev], base*60)[1] for ev in event_set) + \
+        -(-max_window // base)
+
+    pyramid = {'event': [], 'station': [], 'base': base,
+               'max_window': max_window}
+    tasks = []
+    for ev in event_set:
+        start = _windows(tlims[ev], base*60)[0]
+        for mag in mag_set:
+            f_mod = cat.get('dBdt', ev, model, mag)
+            f_obs = cat.get('dBdt', ev, 'OBS', mag)
+            if f_obs is None or f_mod is None:
+                if verbose:
+                    print(f"Warning: magnetometer {mag} not found")
+                continue
+
+            tasks += [(f_obs, start, base*60, nbins, dtype),
+                      (f_mod, start, base*60, nbins, dtype)]
+            pyramid['event'].append(ev)
+            pyramid['station'].append(mag.upper())
+
+    # Observations and model alternate in the binned results:
+    maxima = _pool_map(_bin_file, tasks, jobs)
+    for x, part in (('obs', maxima[0::2]), ('mod', maxima[1::2])):
+        pyramid[x] = MaxPyramid(np.array(part).reshape(-1, nbins), base*60)
+    pyramid['event'] = np.array(pyramid['event'], dtype=int)
+    pyramid['station'] = np.array(pyramid['station'], dtype='U3')
+
+    return pyramid
+
+
+def window_sweep(model, windows=(5, 10, 20, 30, 60), event_set='all',
+                 mag_set='all', thresh=0.3, modthresh=None, verbose=False,
+                 jobs=1, dtype=None):
+    '''
+    Compute contingency counts and metrics for *model* for several window
+    lengths at once.  The data are read and binned only once, into the
+    1-minute bins of a `MaxPyramid` (see `build_pyramid`); the maxima for
+    each window length are then found from the pyramid.  Counts for each
+    window length are identical to those of `build_table`.
+
+    Results are returned as a dictionary of arrays with one entry per
+    window length: 'window' (minutes), counts 'hit', 'miss', 'falseP', and
+    'trueN', and metrics 'pod', 'pofd', 'hss', and 'bias'.
+
+    Parameters
+    ==========
+    model : str or dict
+       What model to use (see *models* list for options), or pyramids
+       returned by `build_pyramid`, which are then reused as they are.
+
+    Other Parameters
+    ================
+    windows : list of int, default=(5, 10, 20, 30, 60)
+        Window lengths in minutes.
+    event_set : list or 'all'
+        List of event numbers to include; see `build_table`.
+    mag_set : str or list
+        Set of magnetometers to include; see `build_table`.
+    thresh : float, default=0.3
+        Event threshold.
+    modthresh : float, default=None
+        Event threshold for the model; defaults to *thresh*.
+    verbose : Boolean, default=False
+        Print a warning for each station that has no data.
+    jobs : int, default=1
+        Number of worker processes used to read and bin the data files; use
+        None or 0 for all CPUs.  Results are identical for any value.
+    dtype : numpy dtype, default=numpy.float64
+        Precision of the data and maxima (see `read_ccmcfile`).
+
+    Examples
+    ========
+    >>> sweep = mmt.window_sweep('9_SWMF', windows=[5, 10, 20, 30, 60])
+    >>> sweep['hss']
+
+    '''
+
+    windows = np.asarray(windows, dtype=int)
+    pyramid = model if isinstance(model, dict) else \
+        build_pyramid(model, event_set, mag_set, max_window=windows.max(),
+                      verbose=verbose, jobs=jobs, dtype=dtype)
+    if not modthresh:
+        modthresh = thresh
+
+    sweep = {x: np.zeros(windows.size, dtype=int)
+             for x in ('hit', 'miss', 'falseP', 'trueN')}
+    for i, window in enumerate(windows):
+        # Each event has its own number of windows; mask the rest.
+        nwin = np.array([_windows(tlims[ev], window*60)[1]
+                         for ev in pyramid['event']], dtype=int)
+        where = np.arange(nwin.max(initial=0)) < nwin[:, None]
+
+        obsmax = pyramid['obs'].maxima(window*60, where.shape[-1])
+        modmax = pyramid['mod'].maxima(window*60, where.shape[-1])
+        obs = obsmax >= _cutoff(thresh, obsmax)
+        mod = modmax >= _cutoff(modthresh, modmax)
+
+        sweep['hit'][i] = np.sum(obs & mod & where)
+        sweep['miss'][i] = np.sum(obs & ~mod & where)
+        sweep['falseP'][i] = np.sum(~obs & mod & where)
+        sweep['trueN'][i] = np.sum(~obs & ~mod & where)
+
+    sweep['window'] = windows
+    sweep['pod'] = _pod(sweep)
+    sweep['pofd'] = _pofd(sweep)
+    sweep['hss'] = _hss(sweep)
+    sweep['bias'] = _bias(sweep)
+
+    return sweep
+
+
+class EnsembleCube(object):
+    '''
+    Binned dB/dt maxima for all ensemble members (models), aligned window
+    by window against a single, shared set of observed maxima.
+
+    Every (event, station) pair with observations is included; each model's
+    windows for that pair are flagged in *valid*, which is False where the
+    model has no data file.  Observations are read once regardless of the
+    number of models, and naive probabilistic classifier (NPC) member
+    counts are a single comparison and sum along the model axis.
+
+    Parameters
+    ==========
+    event_set : list or 'all'
+        List of event numbers to include; see `build_table`.
+    mag_set : str or list
+        Set of magnetometers to include; see `build_table`.
+
+    Other Parameters
+    ================
+    window : int, default=20
+        Set the interval window in minutes; defaults to 20.
+    stride : int, default=None
+        Start a window every *stride* minutes, e.g., 1 for overlapping
+        windows issued every minute.  Defaults to *window*.
+    members : list, default=None
+        Models to include; defaults to *modnames*.
+    verbose : Boolean, default=False
+        Print a warning for each station that has no data.
+    jobs : int, default=1
+        Number of worker processes used to read and bin the data files; use
+        None or 0 for all CPUs.  Results are identical for any value.
+    dtype : numpy dtype, default=numpy.float64
+        Precision of the data and window maxima, e.g., `numpy.float32` to
+        halve memory use (see `read_ccmcfile`).  Thresholds are compared at
+        this precision.
+
+    Attributes
+    ==========
+    members : list
+        Model names, in the order of the first axis of *modmax*.
+    obsmax : array, shape (n_windows,)
+        Observed maximum in each window.
+    modmax : array, shape (n_models, n_windows)
+        Model maximum in each window; NaN where invalid.
+    valid : boolean array, shape (n_models, n_windows)
+        True where the model has data for the window's station and event.
+    time, event, station : arrays, shape (n_windows,)
+        Window center time, event number, and station code of each window.
+
+    Examples
+    ========
+    Compare SWMF against a 2-member NPC forecast for all events:
+
+    >>> cube = mmt.EnsembleCube()
+    >>> det = cube.table('9_SWMF', 0.3)
+    >>> npc = cube.npc_table(0.3, n_models=2)
+    >>> npc.calc_heidke() - det.calc_heidke()
+
+    '''
+
+    def __init__(self, event_set='all', mag_set='all', window=20,
+                 members=None, verbose=False, jobs=1, dtype=np.float64,
+                 stride=None):
+
+        event_set, mag_set = _parse_sets(event_set, mag_set)
+        self.members = list(modnames if members is None else members)
+        self.window, self.stride = window, stride if stride else window
+        self.dtype = np.dtype(dtype)
+
+        # The default precision keeps the masked float64 reader output:
+        rdtype = None if self.dtype == np.float64 else self.dtype
+        cat = get_catalog()
+        window, stride = window * 60, self.stride * 60
+
+        obs, mod, valid, tasks = [], [], [], []
+        labels = {x: [] for x in ('time', 'event', 'station')}
+        for ev in event_set:
+            start, nwin = _windows(tlims[ev], stride)
+            for mag in mag_set:
+                f_obs = cat.get('dBdt', ev, 'OBS', mag)
+                files = [cat.get('dBdt', ev, m, mag) for m in self.members]
+                if f_obs is None or not any(files):
+                    if verbose:
+                        print(f"Warning: magnetometer {mag} not found")
+                    continue
+
+                # Bin all available files together below:
+                tasks += [(f, start, window, nwin, rdtype, stride)
+                          for f in [f_obs] + files if f is not None]
+                obs.append(f_obs)
+                mod.append([(f, nwin) for f in files])
+                valid.append([np.full(nwin, f is not None) for f in files])
+
+                labels['time'].append(
+                    _centers(start, window, nwin, stride))
+                labels['event'].append(np.full(nwin, ev))
+                labels['station'].append(np.full(nwin, mag.upper()))
+
+        # Replace file names with their window maxima, in task order:
+        maxima = iter(_pool_map(_bin_file, tasks, jobs))
+        for i, files in enumerate(mod):
+            obs[i] = next(maxima)
+            mod[i] = [np.full(nwin, np.nan, self.dtype) if f is None
+                      else next(maxima) for f, nwin in files]
+
+        nmod = len(self.members)
+        self.obsmax = np.concatenate(obs) if obs \
+            else np.zeros(0, self.dtype)
+        self.modmax = np.concatenate(mod, axis=1) if mod \
+            else np.zeros((nmod, 0), self.dtype)
+        self.valid = np.concatenate(valid, axis=1) if valid \
+            else np.zeros((nmod, 0), dtype=bool)
+        for x, dtype in (('time', 'datetime64[s]'), ('event', int),
+                         ('station', 'U3')):
+            setattr(self, x, np.concatenate(labels[x]) if labels[x]
+                    else np.zeros(0, dtype=dtype))
+
+    def __repr__(self):
+        return f'EnsembleCube of {len(self.members)} models x ' + \
+            f'{self.obsmax.size} windows'
+
+    def _threshes(self, thresh):
+        '''Broadcast a scalar or per-model threshold along model axis.'''
+        return np.broadcast_to(np.asarray(thresh, dtype=self.dtype),
+                               (len(self.members),))[:, None]
+
+    def count(self, thresh):
+        '''
+        Return the number of members at or above *thresh* in each window.
+        *thresh* may be a scalar or a list with one threshold per member.
+        '''
+
+        return np.sum(self.modmax >= self._threshes(thresh), axis=0)
+
+    def npc(self, thresh, n_models=2):
+        '''
+        Return the NPC forecast: True for windows where at least *n_models*
+        members meet or exceed *thresh* (scalar or one per member).
+        '''
+
+        return self.count(thresh) >= n_models
+
+    def table(self, model, thresh, modthresh=None):
+        '''
+        Return the `BinaryEventTable` for a single member, *model*, using
+        only the windows where it has data.
+        '''
+
+        i = self.members.index(model)
+        loc = self.valid[i]
+
+        return BinaryEventTable.from_maxima(
+            self.obsmax[loc], self.modmax[i, loc], thresh,
+            modelcutoff=modthresh, time=self.time[loc], window=self.window*60,
+            stride=self.stride*60)
+
+    def npc_table(self, thresh, n_models=2, modthresh=None):
+        '''
+        Return the `BinaryEventTable` for the NPC forecast.  Events are
+        observed at *thresh*; an event is forecast when at least *n_models*
+        members meet or exceed *modthresh* (defaults to *thresh*; may be
+        one threshold per member).  The table's *modmax* holds the member
+        count of each window.
+        '''
+
+        if modthresh is None:
+            modthresh = thresh
+
+        return BinaryEventTable.from_maxima(
+            self.obsmax, self.count(modthresh), thresh,
+            modelcutoff=n_models, time=self.time, window=self.window*60,
+            stride=self.stride*60)
+
+    def select(self, event_set='all', mag_set='all'):
+        '''
+        Return a new cube holding only the windows of the given events and
+        magnetometers (see `build_table`), e.g., to evaluate the 'hi' and
+        'lo' groups from a single cube built for 'all'.  Nothing is read or
+        binned again.
+        '''
+
+        event_set, mag_set = _parse_sets(event_set, mag_set)
+        loc = np.isin(self.event, event_set) & \
+            np.isin(self.station, [m.upper() for m in mag_set])
+
+        cube = copy.copy(self)
+        for x in ('obsmax', 'time', 'event', 'station'):
+            setattr(cube, x, getattr(self, x)[loc])
+        for x in ('modmax', 'valid'):
+            setattr(cube, x, getattr(self, x)[:, loc])
+
+        return cube
+
+    def breakdown(self, thresh, n_models=2, model=None, modthresh=None):
+        '''
+        Return the contingency counts of each (event, station) pair as a
+        structured array with fields 'event', 'station', 'hit', 'miss',
+        'falseP', and 'trueN', in the order the pairs appear in the cube.
+
+        Counts are for the NPC forecast (see `npc_table`) or, if *model*
+        is given, for that member alone (see `table`).  Counts add up
+        across windows, so those of any set of stations or events are the
+        sum of their rows: e.g., dropping one station's row from the total
+        gives a leave-one-out result without building anything again.
+
+        Examples
+        ========
+        HSS of the 2-member NPC with each station left out in turn:
+
+        >>> rows = mmt.EnsembleCube().breakdown(0.3, n_models=2)
+        >>> total = {k: rows[k].sum() for k in ('hit', 'miss', 'falseP',
+        ...                                      'trueN')}
+        >>> for stn in np.unique(rows['station']):
+        ...     out = rows[rows['station'] == stn]
+        ...     print(stn, mmt._hss({k: total[k] - out[k].sum()
+        ...                          for k in total}))
+
+        '''
+
+        if model is None:
+            table = self.npc_table(thresh, n_models, modthresh)
+            loc = slice(None)
+        else:
+            table = self.table(model, thresh, modthresh)
+            loc = self.valid[self.members.index(model)]
+        event, station = self.event[loc], self.station[loc]
+
+        # Label each window with its (event, station) pair:
+        pairs, first, inv = np.unique(
+            np.char.add(event.astype('U3'), station), return_index=True,
+            return_inverse=True)
+        order = np.argsort(first)
+        rank = np.empty_like(order)
+        rank[order] = np.arange(order.size)
+        inv = rank[inv.ravel()]
+
+        obs = table.obsmax >= _cutoff(thresh, table.obsmax)
+        rows = np.zeros(pairs.size, dtype=[
+            ('event', int), ('station', 'U3'), ('hit', int), ('miss', int),
+            ('falseP', int), ('trueN', int)])
+        rows['event'] = event[first[order]]
+        rows['station'] = station[first[order]]
+        for k, flag in (('hit', obs & table.bool),
+                        ('miss', obs & ~table.bool),
+                        ('falseP', ~obs & table.bool),
+                        ('trueN', ~obs & ~table.bool)):
+            rows[k] = np.bincount(inv, weights=flag, minlength=pairs.size)
+
+        return rows
+
+
+def _group_masks(station, groups):
+    '''
+    Return a (n_groups, n_windows) boolean array flagging which windows,
+    labeled by *station*, belong to each magnetometer group in *groups*
+    (a dictionary of group names to `build_table`-style mag sets).
+    '''
+
+    masks = []
+    for g in groups:
+        mags = [m.upper() for m in _parse_sets('all', groups[g])[1]]
+        masks.append(np.isin(station, mags))
+
+    return np.array(masks).reshape(len(groups), station.size)
+
+
+def _sweep_counts(obs, fcst, where):
+    '''
+    Count hits, misses, etc. over the last (window) axis for boolean arrays
+    of observed events *obs*, forecast events *fcst*, and windows to use,
+    *where*, which must broadcast against each other.
+    '''
+
+    return {'hit': np.sum(obs & fcst & where, axis=-1),
+            'miss': np.sum(obs & ~fcst & where, axis=-1),
+            'falseP': np.sum(~obs & fcst & where, axis=-1),
+            'trueN': np.sum(~obs & ~fcst & where, axis=-1)}
+
+
+# Fields of the tables returned by npc_sweep and npc_results:
+_sweep_dtype = np.dtype(
+    [('thresh', float), ('n_required', int), ('group', 'U16')] +
+    [(p + k, int) for p in ('', 'det_', 'or_')
+     for k in ('hit', 'miss', 'falseP', 'trueN')] +
+    [(p + k, float) for p in ('', 'det_', 'or_')
+     for k in ('pod', 'pofd', 'hss', 'bias')])
+
+
+def npc_sweep(cube, threshes=thres_dt, n_required=None, groups=None,
+              reference='9_SWMF', modthresh=None):
+    '''
+    Evaluate the NPC forecast for every combination of threshold, number of
+    members required, and magnetometer group in a single vectorized pass
+    over an `EnsembleCube`, alongside the deterministic *reference* model.
+
+    Results are returned as a structured array with one row per
+    (thresh, n_required, group), sorted in that order, with fields:
+    'thresh', 'n_required', 'group', the NPC counts ('hit', 'miss',
+    'falseP', 'trueN') and metrics ('pod', 'pofd', 'hss', 'bias'), the
+    reference model's counts and metrics ('det_hit', ..., 'det_pod', ...),
+    and those of the combined forecast "reference OR NPC", which forecasts
+    an event when either does ('or_hit', ..., 'or_pod', ...).
+
+    Parameters
+    ==========
+    cube : EnsembleCube
+        Binned ensemble; must include all stations used in *groups*.
+
+    Other Parameters
+    ================
+    threshes : list of floats, default=thres_dt
+        Event thresholds, used for both observations and models.
+    n_required : list of ints, default=None
+        Number of members that must meet the threshold for the NPC to
+        forecast an event.  Defaults to 1 through the number of members.
+    groups : dict, default=None
+        Magnetometer groups, mapping names to a mag set as accepted by
+        `build_table`.  Defaults to 'all', 'hi', and 'lo'.
+    reference : str, default='9_SWMF'
+        Deterministic model to compare against.
+    modthresh : float or list of floats, default=None
+        Thresholds the members must meet for the NPC forecast, either one
+        for all or one per member; defaults to each of *threshes*.  The
+        reference model always uses *threshes*.
+
+    Examples
+    ========
+    >>> sweep = mmt.npc_sweep(mmt.EnsembleCube())
+    >>> row = sweep[(sweep['thresh'] == 0.3) & (sweep['n_required'] == 2)]
+    >>> row['hss'] - row['det_hss']
+
+    '''
+
+    if n_required is None:
+        n_required = np.arange(1, len(cube.members) + 1)
+    if groups is None:
+        groups = {'all': 'all', 'hi': 'hi', 'lo': 'lo'}
+    threshes = np.atleast_1d(np.asarray(threshes, dtype=float))
+    n_required = np.atleast_1d(n_required)
+    names = list(groups)
+
+    # Axes are (threshold, n_required, group, window):
+    th = _cutoff(threshes, cube.obsmax)[:, None]
+    where = _group_masks(cube.station, groups)[None, None, :, :]
+    obs = (cube.obsmax >= th)[:, None, None, :]
+
+    # NPC: count members above each threshold, compare with n_required.
+    mth = th[:, :, None] if modthresh is None else \
+        cube._threshes(modthresh)[None, :, :]
+    count = np.sum(cube.modmax[None, :, :] >= mth, axis=1)
+    fcst = count[:, None, None, :] >= n_required[None, :, None, None]
+    npc = _sweep_counts(obs, fcst, where)
+
+    # Deterministic reference, only where it has data:
+    i = cube.members.index(reference)
+    ref = (cube.modmax[i] >= th)[:, None, None, :]
+    det = _sweep_counts(obs, ref, where & cube.valid[i])
+
+    # Either forecasts an event; without reference data, only the NPC can:
+    both = _sweep_counts(obs, fcst | ref, where)
+
+    # Pack into a tidy table:
+    shape = (threshes.size, n_required.size, len(names))
+    sweep = np.zeros(np.prod(shape), dtype=_sweep_dtype)
+
+    grid = np.meshgrid(threshes, n_required, np.array(names), indexing='ij')
+    for x, g in zip(('thresh', 'n_required', 'group'), grid):
+        sweep[x] = g.ravel()
+    for p, counts in (('', npc), ('det_', det), ('or_', both)):
+        for k in counts:
+            sweep[p + k] = np.broadcast_to(counts[k], shape).ravel()
+        for k, func in (('pod', _pod), ('pofd', _pofd), ('hss', _hss),
+                        ('bias', _bias)):
+            sweep[p + k] = np.broadcast_to(func(counts), shape).ravel()
+
+    return sweep
+
+
+def _results_key(forecast, events='all', mags='all', thresh=0.3,
+                 modthresh=None, n_required=0, window=20, stride=None):
+    '''
+    Return the normalized key of a row of the `ResultsStore`, so that,
+    e.g., events 'all' and [1, 2, 3, 4, 7, 8], mags 'lo' and 'low', a
+    *modthresh* of None and one equal to *thresh*, or a *stride* of None
+    and one equal to *window* match.
+    '''
+
+    events, mags = _parse_sets(events, mags)
+    stations = sorted(m.upper() for m in mags)
+    for name, group in (('all', allmag), ('hi', hilat), ('lo', lolat)):
+        if stations == sorted(m.upper() for m in group):
+            mags = name
+            break
+    else:
+        mags = ','.join(stations)
+
+    # A model threshold equal to the observed one is the default:
+    thresh = round(float(thresh), 6)
+    modthresh = [] if modthresh is None else \
+        [float(x) for x in np.atleast_1d(modthresh)]
+    if all(round(x, 6) == thresh for x in modthresh):
+        modthresh = ''
+    else:
+        modthresh = ','.join(f'{x:.6g}' for x in modthresh)
+
+    return (forecast, ','.join(str(e) for e in sorted(events)), mags,
+            thresh, modthresh, int(n_required), int(window),
+            int(window if stride is None else stride))
+
+
+class ResultsStore(object):
+    '''
+    A persistent SQLite table of forecast metrics, so that results computed
+    once (by the analysis scripts, `npc_results`, etc.) can be looked up
+    instead of recomputed, e.g., when making figures.
+
+    Each row holds the contingency table counts ('hit', 'miss', 'falseP',
+    'trueN') and metrics ('pod', 'pofd', 'hss', 'bias') of one forecast,
+    keyed by:
+
+    - forecast: a model name (e.g., '9_SWMF') or 'NPC' for the ensemble.
+    - events: the event set, stored as, e.g., '1,2,3,4,7,8'.
+    - mags: 'all', 'hi', 'lo', or a list of stations, e.g., 'ABK,YKC'.
+    - thresh: the observed event threshold.
+    - modthresh: the model threshold(s), '' if the same as *thresh*.
+    - n_required: members required for an NPC event, 0 for single models.
+    - window: the window size in minutes.
+    - stride: the time between window starts in minutes; the same as
+      *window* unless windows overlap.
+
+    Arguments for these are normalized, so any form accepted by
+    `build_table` can be used.  Adding a row with an existing key replaces
+    it.  Rows are not tied to the data; call `clear` after changing data
+    files or the analysis code.
+
+    Parameters
+    ==========
+    filename : str, default=None
+        SQLite database file.  Defaults to *resultsfile*.
+
+    Examples
+    ========
+    Store the metrics of a binary event table, then look them up later:
+
+    >>> store = mmt.ResultsStore()
+    >>> table = mmt.build_table('9_SWMF', event_set=2, mag_set='hi')
+    >>> store.add(table, '9_SWMF', events=2, mags='hi')
+    >>> store.get('9_SWMF', events=2, mags='hi')['hss']
+
+    '''
+
+    keys = ('forecast', 'events', 'mags', 'thresh', 'modthresh',
+            'n_required', 'window', 'stride')
+    counts = ('hit', 'miss', 'falseP', 'trueN')
+    metrics = ('pod', 'pofd', 'hss', 'bias')
+
+    def __init__(self, filename=None):
+        import sqlite3
+
+        self.filename = resultsfile if filename is None else filename
+        if os.path.dirname(self.filename):
+            os.makedirs(os.path.dirname(self.filename), exist_ok=True)
+
+        self._con = sqlite3.connect(self.filename, timeout=60)
+        schema = '(forecast TEXT, events TEXT, mags TEXT, thresh REAL, ' + \
+            'modthresh TEXT, n_required INTEGER, window INTEGER, ' + \
+            'stride INTEGER, ' + \
+            ', '.join(f'{k} INTEGER' for k in self.counts) + ', ' + \
+            ', '.join(f'{k} REAL' for k in self.metrics) + ', ' + \
+            f'PRIMARY KEY ({", ".join(self.keys)}))'
+        with self._con:
+            self._con.execute(f'CREATE TABLE IF NOT EXISTS metrics {schema}')
+
+            # Stores from before the stride key only hold rows of
+            # non-overlapping windows:
+            columns = [c[1] for c in
+                       self._con.execute('PRAGMA table_info(metrics)')]
+            if 'stride' not in columns:
+                old = [k for k in self.keys + self.counts + self.metrics
+                       if k != 'stride']
+                self._con.execute('ALTER TABLE metrics RENAME TO old')
+                self._con.execute(f'CREATE TABLE metrics {schema}')
+                self._con.execute(
+                    f'INSERT INTO metrics ({", ".join(old)}, stride) ' +
+                    f'SELECT {", ".join(old)}, window FROM old')
+                self._con.execute('DROP TABLE old')
+
+    def __len__(self):
+        return self._con.execute('SELECT COUNT(*) FROM metrics').fetchone()[0]
+
+    def __repr__(self):
+        return f'ResultsStore of {len(self)} rows in {self.filename}'
+
+    def add(self, counts, forecast, events='all', mags='all', thresh=0.3,
+            modthresh=None, n_required=0, window=20, stride=None):
+        '''
+        Store the contingency table *counts* (a `BinaryEventTable` or any
+        mapping of 'hit', 'miss', 'falseP', and 'trueN') of *forecast*
+        under the given key; see the class documentation.  The *stride*
+        of a table with overlapping windows is taken from the table.
+        '''
+
+        if stride is None and isinstance(counts, BinaryEventTable) and \
+                counts.stride != counts.window:
+            stride = counts.stride // 60
+
+        self.add_rows([({'forecast': forecast, 'events': events,
+                         'mags': mags, 'thresh': thresh,
+                         'modthresh': modthresh, 'n_required': n_required,
+                         'window': window, 'stride': stride}, counts)])
+
+    def add_rows(self, rows):
+        '''
+        Store many (key, counts) pairs in one transaction, where each key
+        is a dictionary of the keyword arguments of `add`.
+        '''
+
+        values = []
+        for key, counts in rows:
+            c = {k: int(counts[k]) for k in self.counts}
+            m = [float(f(c)) for f in (_pod, _pofd, _hss, _bias)]
+            values.append(_results_key(**key) +
+                          tuple(c[k] for k in self.counts) +
+                          tuple(None if np.isnan(x) else x for x in m))
+
+        with self._con:
+            self._con.executemany(
+                'INSERT OR REPLACE INTO metrics VALUES (' +
+                ', '.join(['?'] * (len(self.keys) + len(self.counts) +
+                                   len(self.metrics))) + ')', values)
+
+    def get(self, forecast, events='all', mags='all', thresh=0.3,
+            modthresh=None, n_required=0, window=20, stride=None):
+        '''
+        Return the stored row for the given key as a dictionary of counts
+        and metrics, or None if there is none.
+        '''
+
+        key = _results_key(forecast, events, mags, thresh, modthresh,
+                           n_required, window, stride)
+        names = self.counts + self.metrics
+        row = self._con.execute(
+            f'SELECT {", ".join(names)} FROM metrics WHERE ' +
+            ' AND '.join(f'{k} = ?' for k in self.keys), key).fetchone()
+        if row is None:
+            return None
+
+        return {k: np.nan if x is None else x for k, x in zip(names, row)}
+
+    def query(self, **criteria):
+        '''
+        Return all rows matching *criteria* (any of the key fields, given
+        in stored form, e.g., events='1,2') as a structured array sorted
+        by key.  Missing metrics are NaN.
+        '''
+
+        unknown = set(criteria) - set(self.keys)
+        if unknown:
+            raise ValueError(f'Unknown key(s): {", ".join(sorted(unknown))}')
+
+        names = self.keys + self.counts + self.metrics
+        where = ' AND '.join(f'{k} = ?' for k in criteria) or '1'
+        rows = self._con.execute(
+            f'SELECT {", ".join(names)} FROM metrics WHERE {where} ' +
+            f'ORDER BY {", ".join(self.keys)}',
+            tuple(criteria.values())).fetchall()
+
+        dtype = [('forecast', 'U64'), ('events', 'U32'), ('mags', 'U64'),
+                 ('thresh', float), ('modthresh', 'U128'),
+                 ('n_required', int), ('window', int), ('stride', int)] + \
+            [(k, int) for k in self.counts] + \
+            [(k, float) for k in self.metrics]
+        return np.array([tuple(np.nan if x is None else x for x in row)
+                         for row in rows], dtype=dtype)
+
+    def clear(self):
+        '''Remove all rows; return the number removed.'''
+
+        with self._con:
+            return self._con.execute('DELETE FROM metrics').rowcount
+
+    def close(self):
+        '''Close the database connection.'''
+        self._con.close()
+
+
+def npc_results(event_set='all', groups=None, threshes=thres_dt,
+                n_required=None, modthresh=None, window=20, members=None,
+                reference='9_SWMF', store=None, jobs=1, stride=None):
+    '''
+    Return the same table as `npc_sweep`, taking each row from the results
+    store where it has already been computed.  Only missing combinations
+    of threshold, members required, and magnetometer group are computed
+    (binning the data only if there are any) and then added to the store.
+
+    Parameters
+    ==========
+    event_set : list or 'all', default='all'
+        Events to include; see `build_table`.
+
+    Other Parameters
+    ================
+    groups : dict, default=None
+        Magnetometer groups, as for `npc_sweep`; defaults to 'all', 'hi',
+        and 'lo'.
+    threshes : list of floats, default=thres_dt
+        Event thresholds.
+    n_required : list of ints, default=None
+        Members required for an NPC event; defaults to 1 through the
+        number of members.
+    modthresh : float or list of floats, default=None
+        Member thresholds for the NPC forecast; see `npc_sweep`.
+    window : int, default=20
+        Window size in minutes.
+    members : list, default=None
+        Ensemble members; defaults to *modnames*.
+    reference : str, default='9_SWMF'
+        Deterministic model to compare against.
+    store : ResultsStore, default=None
+        Where to look up and add results; defaults to *resultsfile*.
+    jobs : int, default=1
+        Number of worker processes for binning; see `EnsembleCube`.
+    stride : int, default=None
+        Start a window every *stride* minutes; defaults to *window*.
+
+    Examples
+    ========
+    The first call computes and stores the sweep; later calls (e.g., when
+    remaking a figure) only read it back:
+
+    >>> sweep = mmt.npc_results(n_required=[1, 2, 3, 4, 5])
+
+    '''
+
+    members = list(modnames if members is None else members)
+    if n_required is None:
+        n_required = np.arange(1, len(members) + 1)
+    if groups is None:
+        groups = {'all': 'all', 'hi': 'hi', 'lo': 'lo'}
+    if store is None:
+        store = ResultsStore()
+    threshes = np.atleast_1d(np.asarray(threshes, dtype=float))
+    n_required = np.atleast_1d(n_required)
+
+    forecast = 'NPC' if members == list(modnames) else \
+        'NPC:' + ','.join(members)
+
+    # Rows of the NPC, reference, and combined ("reference OR NPC")
+    # forecasts; the last is stored as, e.g., '9_SWMF|NPC':
+    def keys(t, n, g):
+        key = {'events': event_set, 'mags': groups[g], 'thresh': t,
+               'window': window, 'stride': stride}
+        return (dict(key, forecast=forecast, modthresh=modthresh,
+                     n_required=n), dict(key, forecast=reference),
+                dict(key, forecast=f'{reference}|{forecast}',
+                     modthresh=modthresh, n_required=n))
+
+    # Find the combinations that have not been computed yet:
+    grid = list(itertools.product(threshes, n_required, groups))
+    missing = [(t, n, g) for t, n, g in grid
+               if any(store.get(**k) is None for k in keys(t, n, g))]
+
+    if missing:
+        need = [sorted(set(x)) for x in zip(*missing)]
+        stations = union_mags([groups[g] for g in need[2]])
+        cube = EnsembleCube(event_set=event_set, mag_set=stations,
+                            window=window, members=members, jobs=jobs,
+                            stride=stride)
+        sweep = npc_sweep(cube, need[0], need[1],
+                          {g: groups[g] for g in need[2]}, reference,
+                          modthresh)
+
+        rows = []
+        for row in sweep:
+            rows += [(key, {k: row[p + k] for k in ResultsStore.counts})
+                     for p, key in zip(('', 'det_', 'or_'),
+                                       keys(row['thresh'], row['n_required'],
+                                            row['group']))]
+        store.add_rows(rows)
+
+    # Assemble the table from the store:
+    result = np.zeros(len(grid), dtype=_sweep_dtype)
+    for i, (t, n, g) in enumerate(grid):
+        result['thresh'][i], result['n_required'][i] = t, n
+        result['group'][i] = g
+        for p, key in zip(('', 'det_', 'or_'), keys(t, n, g)):
+            for k, x in store.get(**key).items():
+                result[p + k][i] = x
+
+    return result
+
+
+class IncrementalEnsemble(object):
+    '''
+    Evaluate the NPC ensemble forecast on live data, one sample at a time.
+
+    Observed and modeled dB/dt samples are pushed as they arrive with
+    `push`.  Each station keeps running window maxima for the observations
+    and every member.  Windows follow the same rules as `EnsembleCube`:
+    they are *window* minutes long, counted from *start*, and include their
+    start time but not their end.  A station's window closes once every
+    source (observations and all members) has delivered a sample at or past
+    its end, once the observations are more than *max_lag* windows past it,
+    or when `close` is called.  Closing a window issues the NPC forecast for
+    it and updates running contingency counts for the NPC and for each
+    member.  Both steps take constant time per sample.
+
+    Missing values are NaN.  Windows without data count as non-events, as
+    in `build_table`, so a member that is late or silent at a station does
+    not hold up its forecasts but scores as no data.  Samples before
+    *start* are ignored; samples for windows that are already closed are
+    dropped and counted in *n_late*.  Use `save` to write a checkpoint and
+    `resume` to pick up from it.
+
+    Parameters
+    ==========
+    start : datetime or datetime64
+        Start time of the first window.
+
+    Other Parameters
+    ================
+    thresh : float, default=0.3
+        Event threshold for the observations.
+    n_models : int, default=2
+        Number of members that must meet their threshold for the NPC to
+        forecast an event.
+    window : int, default=20
+        Set the interval window in minutes; defaults to 20.
+    members : list, default=None
+        Models in the ensemble; defaults to *modnames*.
+    modthresh : float or list, default=None
+        Event threshold for the members, either one value or one per
+        member.  Defaults to *thresh*.
+    max_lag : int, default=1
+        Number of windows the members may lag behind the observations
+        before a window is closed without their data.
+
+    Attributes
+    ==========
+    counts : dict
+        Running 'hit', 'miss', 'falseP', and 'trueN' counts for 'npc' and
+        for each member.
+    n_late : int
+        Number of samples dropped because their window had closed.
+
+    Examples
+    ========
+    >>> live = mmt.IncrementalEnsemble(mmt.tlims[2][0])
+    >>> for t, stn, src, value in feed:
+    ...     for win in live.push(t, stn, src, value):
+    ...         print(win['time'], win['station'], win['forecast'])
+    >>> live.close()
+    >>> live.metrics()['hss']
+
+    '''
+
+    def __init__(self, start, thresh=0.3, n_models=2, window=20,
+                 members=None, modthresh=None, max_lag=1):
+
+        self.start = np.datetime64(start, 's')
+        self.thresh, self.n_models, self.window = thresh, n_models, window
+        self.max_lag = max_lag
+        self.members = list(modnames if members is None else members)
+        self.modthresh = list(np.broadcast_to(
+            thresh if modthresh is None else modthresh,
+            (len(self.members),)))
+        self.sources = ['OBS'] + self.members
+        self.counts = {name: {'hit': 0, 'miss': 0, 'falseP': 0, 'trueN': 0}
+                       for name in ['npc'] + self.members}
+        self.n_late = 0
+
+        # Per station: index of the next window to close, open windows
+        # (index -> maximum of each source), and the last window index
+        # seen from each source.
+        self._next = {}
+        self._open = {}
+        self._seen = {}
+
+    def __repr__(self):
+        return f'IncrementalEnsemble: {len(self._next)} stations, ' + \
+            f'NPC {self.counts["npc"]}'
+
+    def push(self, time, station, source, value):
+        '''
+        Add one sample of *value* at *time* from *source* ('OBS' or a
+        member name) at *station*.  Returns a list of the windows closed by
+        this sample (see `close`); usually empty.
+        '''
+
+        if source not in self.sources:
+            raise ValueError(f'Unknown source: {source}')
+        station = station.upper()
+        if station not in self._next:
+            self._next[station] = 0
+            self._open[station] = {}
+            self._seen[station] = [-1] * len(self.sources)
+
+        # Update the running maximum of this sample's window:
+        offset = (np.datetime64(time, 's') - self.start).astype(int)
+        i = int(offset // (self.window * 60))
+        if i < 0:
+            return []
+        if i < self._next[station]:
+            self.n_late += 1
+            return []
+        isrc = self.sources.index(source)
+        maxes = self._open[station].setdefault(
+            i, [np.nan] * len(self.sources))
+        maxes[isrc] = float(np.fmax(maxes[isrc], value))
+
+        # Windows before the oldest latest window of all sources are done,
+        # as are those more than max_lag windows behind the observations:
+        seen = self._seen[station]
+        seen[isrc] = max(seen[isrc], i)
+        return self._close_station(
+            station, max(min(seen), seen[0] - self.max_lag))
+
+    def _close_station(self, station, until):
+        '''Close all windows of *station* with index less than *until*.'''
+
+        closed = []
+        while self._next[station] < until:
+            i = self._next[station]
+            maxes = self._open[station].pop(i, [np.nan] * len(self.sources))
+            closed.append(self._close_window(station, i, maxes))
+            self._next[station] += 1
+
+        return closed
+
+    def _close_window(self, station, i, maxes):
+        '''Issue the forecast for one window and update running counts.'''
+
+        obs = maxes[0] >= self.thresh
+        fcst = [m >= t for m, t in zip(maxes[1:], self.modthresh)]
+        count = sum(fcst)
+        npc = count >= self.n_models
+
+        for name, pred in [('npc', npc)] + list(zip(self.members, fcst)):
+            key = ('hit' if pred else 'miss') if obs else \
+                ('falseP' if pred else 'trueN')
+            self.counts[name][key] += 1
+
+        center = self.start + np.timedelta64(
+            (2*i + 1) * self.window * 30, 's')
+
+        return {'time': center, 'station': station, 'obsmax': maxes[0],
+                'modmax': maxes[1:], 'count': count, 'forecast': npc,
+                'observed': obs}
+
+    def close(self, until=None):
+        '''
+        Close, for every station, all windows that end at or before
+        *until* (datetime or datetime64), or all open windows if *until*
+        is None.  Returns a list of the closed windows, each a dictionary
+        of its center 'time', 'station', 'obsmax', 'modmax' (one per
+        member), member 'count', NPC 'forecast', and 'observed' event.
+        '''
+
+        closed = []
+        for station in sorted(self._next):
+            if until is None:
+                last = max(self._open[station], default=-1) + 1
+            else:
+                offset = (np.datetime64(until, 's') - self.start).astype(int)
+                last = int(offset // (self.window * 60))
+            closed += self._close_station(station, last)
+
+        return closed
+
+    def metrics(self, name='npc'):
+        '''
+        Return the PoD, PoFD, HSS, and bias of the running counts for
+        *name*, either 'npc' or a member, as a dictionary.
+        '''
+
+        c = self.counts[name]
+        return {'pod': _pod(c), 'pofd': _pofd(c), 'hss': _hss(c),
+                'bias': _bias(c)}
+
+    def save(self, filename):
+        '''
+        Write a checkpoint of the current state to *filename* (JSON).  The
+        file is replaced atomically, so an interrupted save never leaves a
+        partial checkpoint behind.
+        '''
+
+        state = {'start': str(self.start), 'thresh': self.thresh,
+                 'n_models': self.n_models, 'window': self.window,
+                 'max_lag': self.max_lag, 'members': self.members,
+                 'modthresh': [float(t) for t in self.modthresh],
+                 'counts': self.counts, 'n_late': self.n_late,
+                 'next': self._next, 'seen': self._seen,
+                 'open': {stn: {str(i): m for i, m in wins.items()}
+                          for stn, wins in self._open.items()}}
+
+        tmp = f'{filename}.{os.getpid()}.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(state, f)
+        os.replace(tmp, filename)
+
+    @classmethod
+    def resume(cls, filename):
+        '''Create an `IncrementalEnsemble` from a checkpoint made by `save`.'''
+
+        with open(filename, 'r') as f:
+            state = json.load(f)
+
+        self = cls(state['start'], thresh=state['thresh'],
+                   n_models=state['n_models'], window=state['window'],
+                   members=state['members'], modthresh=state['modthresh'],
+                   max_lag=state.get('max_lag', 1))
+        self.counts, self.n_late = state['counts'], state['n_late']
+        self._next, self._seen = state['next'], state['seen']
+        self._open = {stn: {int(i): m for i, m in wins.items()}
+                      for stn, wins in state['open'].items()}
+
+        return self
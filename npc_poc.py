@@ -10,7 +10,6 @@ import numpy as np
 import matplotlib.pyplot as plt
 
 from spacepy.plot import style, applySmartTimeTicks
-from validator import BinaryEventTable
 import multimodtools as mmt
 
 style()
@@ -22,18 +21,13 @@ tab_kwargs = {'event_set':[event], 'mag_set':[mag], 'thresh':thresh}
 # Create tables for all 5 models.
 tables = {}
 for m in mmt.models:
-    tables[mmt.models[m]] = mmt.build_table(m, **tab_kwargs)
+    tables[mmt.models[m]] = mmt.build_table(m, keep_raw=True, **tab_kwargs)
 
 
 # Create NPC by counting the number of crossings in each bin
 # across all ensemble members (i.e., models)
-mod = np.zeros(tables['SWMF'].obsmax.size)
-for tab in tables:
-    mod += 1*tables[tab].bool
-
-npc_forecast = 1.1 * thresh * (mod>=2)
-npc_tab = BinaryEventTable(tables['SWMF'].tObs, tables['SWMF'].Obs, tables['SWMF'].time, 
-                           npc_forecast, thresh, trange=mmt.tlims[event], window=20*60)
+cube = mmt.EnsembleCube(event_set=[event], mag_set=[mag])
+npc_tab = cube.npc_table(thresh, n_models=2)
 
 # Create a cool plot:
 fig = plt.figure(figsize=(10,7))
@@ -57,9 +51,10 @@ a2.plot(tables['SWMF'].time, tables['SWMF'].modmax, '*', c='gold', label='SWMF')
 a2.legend(loc='best')
 
 a1.set_title(f"Multi-Model Forecast: {tab_kwargs['mag_set'][0]}")
+# Spacepy's tick formatting needs datetimes rather than datetime64:
 for ax in (a1, a2):
-    applySmartTimeTicks(ax, mmt.tlims[tab_kwargs['event_set'][0]],
-                        dolabel=ax is a2)
+    trange = mmt.tlims[tab_kwargs['event_set'][0]].astype(object)
+    applySmartTimeTicks(ax, trange, dolabel=ax is a2)
     ax.set_ylabel(r'$|\frac{dB_H}{dt}|$ ($nT/s$)')
     ax.hlines(tab_kwargs['thresh'], *mmt.tlims[tab_kwargs['event_set'][0]],
               linestyles='dashed', colors='k')
@@ -4,10 +4,18 @@ Use Python's unittest module to ensure proper behavior of all
 functions/scripts/etc.
 '''
 
-import numpy as np
+import io
+import os
+import sqlite3
+import sys
+import tempfile
+import contextlib
+import subprocess
 import datetime as dt
 import unittest
 
+import numpy as np
+
 import multimodtools as mmt
 
 datadir = mmt.install_dir+'data/'
@@ -91,6 +99,9 @@ class TestMultiModTools(unittest.TestCase):
             self.assertEqual(obs[k][0], self.known_obs_dt[k][0])
             self.assertEqual(obs[k][-1], self.known_obs_dt[k][-1])
 
+        # Times are datetime64, not objects:
+        self.assertEqual(obs['time'].dtype, np.dtype('datetime64[s]'))
+
     def test_read_weigel(self):
         '''
         Weigel files have a different format, check if we can still read.
@@ -102,6 +113,346 @@ class TestMultiModTools(unittest.TestCase):
         self.assertEqual(mod['time'][0], dt.datetime(2003, 10, 29, 0, 0, 30))
         self.assertEqual(mod['dbn'][8], -0.057)
 
+    def test_read_doubleheader(self):
+        '''
+        Some observation files have two headers; the last one is correct.
+        '''
+
+        obs = mmt.read_ccmcfile(
+            datadir + 'dBdt/Event2/Observations/fur_OBS_20061214.txt')
+        self.assertEqual(obs['time'][0], dt.datetime(2006, 12, 14, 0, 2, 30))
+        self.assertEqual(obs['dbe'][0], 0.0083)
+        self.assertEqual(obs['dbh'].size, obs['time'].size)
+
+    def test_cache(self):
+        '''Test that cached reads match text parsing and can be cleared'''
+
+        # Use a scratch cache directory; bypass the in-process memo:
+        orig, origmax = mmt.cachedir, mmt.memo_maxbytes
+        with tempfile.TemporaryDirectory() as tmpdir:
+            mmt.cachedir, mmt.memo_maxbytes = tmpdir, 0
+            mmt.clear_memo()
+            try:
+                raw = mmt.read_ccmcfile(self.obs_file_dt, cache=False)
+                first = mmt.read_ccmcfile(self.obs_file_dt, cache=True)
+                second = mmt.read_ccmcfile(self.obs_file_dt, cache=True)
+                self.assertEqual(len(os.listdir(tmpdir)), 1)
+
+                for k in raw:
+                    for data in (first, second):
+                        self.assertTrue((raw[k] == data[k]).all())
+                        if k != 'time':
+                            self.assertTrue(
+                                (raw[k].mask == data[k].mask).all())
+
+                self.assertEqual(mmt.clear_cache(), 1)
+                self.assertEqual(len(os.listdir(tmpdir)), 0)
+            finally:
+                mmt.cachedir, mmt.memo_maxbytes = orig, origmax
+
+    def test_cache_unwritable(self):
+        '''Test that reading works when the cache cannot be written'''
+
+        orig, origmax = mmt.cachedir, mmt.memo_maxbytes
+        origcat = mmt._catalog
+        with tempfile.NamedTemporaryFile() as blocker:
+            # A cache directory below a regular file can never be created:
+            mmt.cachedir = os.path.join(blocker.name, 'cache')
+            mmt.memo_maxbytes = 0
+            try:
+                data = mmt.read_ccmcfile(self.obs_file_dt, cache=True)
+                raw = mmt.read_ccmcfile(self.obs_file_dt, cache=False)
+                for k in raw:
+                    self.assertTrue((raw[k] == data[k]).all())
+
+                # Neither can the catalog be saved:
+                mmt._catalog = None
+                table = mmt.build_table('2_LFM-MIX', event_set=[2],
+                                        mag_set='hi', verbose=False)
+                self.assertEqual(table['hit'], 145)
+            finally:
+                mmt.cachedir, mmt.memo_maxbytes = orig, origmax
+                mmt._catalog = origcat
+
+    def test_memo(self):
+        '''Test that repeat reads come from the memo as read-only arrays'''
+
+        mmt.clear_memo()
+        first = mmt.read_ccmcfile(self.obs_file_db)
+        second = mmt.read_ccmcfile(self.obs_file_db)
+        self.assertEqual(mmt.memo_stats, {'hits': 1, 'misses': 1})
+        self.assertIs(first['bh'], second['bh'])
+        info = mmt.memo_info()
+        self.assertEqual(info['entries'], 1)
+        self.assertEqual(info['rows'], first['time'].size)
+
+        with self.assertRaises(ValueError):
+            first['bn'][0] = 0.0
+
+        # A zero-byte budget disables the memo:
+        orig = mmt.memo_maxbytes
+        mmt.memo_maxbytes = 0
+        try:
+            mmt.clear_memo()
+            mmt.read_ccmcfile(self.obs_file_db)
+            mmt.read_ccmcfile(self.obs_file_db)
+            self.assertEqual(mmt.memo_stats, {'hits': 0, 'misses': 2})
+        finally:
+            mmt.memo_maxbytes = orig
+
+    def test_catalog(self):
+        '''Test finding data files through the catalog'''
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            cachefile = os.path.join(tmpdir, 'catalog.json')
+            cat = mmt.Catalog(cachefile=cachefile)
+            self.assertTrue(os.path.exists(cachefile))
+
+            # Reloading from the cache file gives the same catalog:
+            self.assertEqual(mmt.Catalog(cachefile=cachefile).files,
+                             cat.files)
+
+            # A cache file that cannot be written only loses the saved scan:
+            lost = mmt.Catalog(cachefile=os.path.join(cachefile, 'cat.json'))
+            self.assertEqual(lost.files, cat.files)
+
+        self.assertEqual(cat.get('dBdt', 1, '2_LFM-MIX', 'abk'),
+                         self.mod_file_dt.replace('//', '/'))
+        self.assertEqual(cat.get('dBdt', 1, 'obs', 'ABK'),
+                         self.obs_file_dt.replace('//', '/'))
+        self.assertIsNone(cat.get('dBdt', 1, '2_LFM-MIX', 'XXX'))
+        self.assertEqual(cat.dates['dBdt', 1, 'OBS', 'ABK'], '20031029')
+
+        # Nested SWMF deltaB run:
+        self.assertEqual(len(cat.find('deltaB', 1, '9a_SWMF')), 12)
+
+        # Stations with both model and observations:
+        self.assertEqual(cat.stations(2, '2_LFM-MIX'),
+                         ['ABK', 'FRD', 'FRN', 'FUR', 'HRN', 'IQA', 'MEA',
+                          'NEW', 'OTT', 'PBQ', 'WNG', 'YKC'])
+
+    def test_sniff(self):
+        '''Test header dialect detection and its caching in the catalog'''
+
+        d = mmt.datadir
+        known = {'dBdt/Event1/2_LFM-MIX/ABK_2_LFM-MIX_Event1.txt':
+                 ('ccmc', 'dBdt'),
+                 'dBdt/Event1/6_WEIMER/ABK_6_WEIMER_Event1.txt':
+                 ('weimer', 'dBdt'),
+                 'dBdt/Event2/3_WEIGEL/YKC_3_WEIGEL_Event2.txt':
+                 ('weigel', 'dBdt'),
+                 'dBdt/Event2/Observations/ykc_OBS_20061214.txt':
+                 ('gem', 'dBdt'),
+                 'dBdt/Event2/Observations/frd_OBS_20061214.txt':
+                 ('gem', 'dBdt'),
+                 'deltaB/Event1/9_SWMF/9a/ABK_9a_SWMF_Event1.txt':
+                 ('gem', 'deltaB'),
+                 'deltaB/Event8/Observations/frn_OBS_20110805.txt':
+                 ('bare', 'deltaB')}
+
+        for relpath, (dialect, quantity) in known.items():
+            # A small read size forces the header to be read in pieces:
+            header = mmt.sniff_header(d + relpath, nbytes=64)
+            self.assertEqual(header['dialect'], dialect)
+            self.assertEqual(header['quantity'], quantity)
+            self.assertEqual(header['ncols'], 11)
+            self.assertEqual(header['usecols'], [0, 1, 2, 3, 4, 8, 9, 10])
+            self.assertEqual(mmt.sniff_header(d + relpath), header)
+
+            # The offset points at the first line of data:
+            with open(d + relpath, 'rb') as f:
+                head = f.read(header['offset'] + 4)
+            self.assertTrue(header['offset'] == 0 or
+                            head[header['offset']-1:].startswith(b'\n'))
+            self.assertTrue(head[header['offset']:].split()[0].isdigit())
+
+        # Header but no data:
+        header = mmt.sniff_header(
+            d + 'dBdt/Event1/2_LFM-MIX/SNK_2_LFM-MIX_Event1.txt')
+        self.assertEqual((header['dialect'], header['ncols']), ('ccmc', 0))
+        self.assertEqual(header['offset'], 444)
+
+        # The catalog keeps headers between sessions:
+        with tempfile.TemporaryDirectory() as tmpdir:
+            cachefile = os.path.join(tmpdir, 'catalog.json')
+            cat = mmt.Catalog(cachefile=cachefile)
+            mmt.profile, mmt.profile_stats = True, {}
+            try:
+                again = mmt.Catalog(cachefile=cachefile)
+                for relpath in known:
+                    again.header(d + relpath)
+            finally:
+                mmt.profile = False
+            self.assertNotIn('sniff', mmt.profile_stats)
+        self.assertEqual(again.headers, cat.headers)
+        self.assertEqual(len(cat.headers), len(cat))
+
+    def test_fix_headers(self):
+        '''Test that fix_headers.py mends headers and leaves data alone'''
+
+        import shutil
+        import fix_headers
+
+        bad = datadir + 'dBdt/Event2/Observations/frd_OBS_20061214.txt'
+        good = datadir + 'dBdt/Event2/Observations/ykc_OBS_20061214.txt'
+        with tempfile.TemporaryDirectory() as tmpdir:
+            for f in (bad, good):
+                shutil.copy2(f, tmpdir)
+            bad, good = (os.path.join(tmpdir, os.path.basename(f))
+                         for f in (bad, good))
+            before = {f: open(f, 'rb').read() for f in (bad, good)}
+
+            # A dry run reports but changes nothing:
+            report = fix_headers.fix_file(bad, 'dBdt', replace=False)
+            self.assertEqual(report['problems'],
+                             ['double', 'quantity', 'units'])
+            self.assertEqual(open(bad, 'rb').read(), before[bad])
+
+            self.assertEqual(fix_headers.fix_file(good, 'dBdt')['problems'],
+                             [])
+            self.assertEqual(fix_headers.fix_file(bad, 'dBdt')['problems'],
+                             report['problems'])
+            self.assertEqual(sorted(os.listdir(tmpdir)),
+                             sorted(map(os.path.basename, (bad, good))))
+            self.assertEqual(open(good, 'rb').read(), before[good])
+
+            after = open(bad, 'rb').read()
+            self.assertEqual(after, report['fixed'].encode() +
+                             before[bad][report['offset']:])
+            self.assertEqual(fix_headers.check_file(bad)['problems'], [])
+
+    def test_store(self):
+        '''Test that series loaded from the store match the text files'''
+
+        orig = mmt.storedir
+        with tempfile.TemporaryDirectory() as tmpdir:
+            mmt.storedir = tmpdir
+            try:
+                self.assertGreater(mmt.build_store(quantities=['dBdt']), 0)
+                mod = mmt.load('dBdt', 1, '2_LFM-MIX', 'abk')
+                obs = mmt.load('dBdt', 1, 'OBS', 'ABK')
+
+                # An unwritable store is reported, not raised:
+                mmt.storedir = os.path.join(tmpdir, 'index.json', 'store')
+                with contextlib.redirect_stderr(io.StringIO()) as err:
+                    self.assertEqual(mmt.build_store(quantities=['dBdt']), 0)
+                self.assertIn('could not write', err.getvalue())
+            finally:
+                mmt.storedir = orig
+                mmt._store.clear()
+
+        for k in self.known_mod_dt.keys():
+            self.assertEqual(mod[k][0], self.known_mod_dt[k][0])
+            self.assertEqual(mod[k][-1], self.known_mod_dt[k][-1])
+
+        # Missing values are NaN rather than masked:
+        ref = mmt.read_ccmcfile(self.obs_file_dt)
+        self.assertTrue((obs['time'] == ref['time'].astype('M8[s]')).all())
+        self.assertTrue(np.array_equal(obs['dbh'], ref['dbh'].filled(np.nan),
+                                       equal_nan=True))
+
+    def test_dtype(self):
+        '''Test that float32 data match the default within tolerance'''
+
+        # The files carry 4-6 significant digits; float32 keeps ~7:
+        rtol = 1e-6
+
+        ref = mmt.read_ccmcfile(self.obs_file_dt)
+        data = mmt.read_ccmcfile(self.obs_file_dt, dtype=np.float32)
+        np.testing.assert_array_equal(data['time'], ref['time'])
+        for k in ('dbn', 'dbe', 'dbz', 'dbh'):
+            self.assertEqual(data[k].dtype, np.float32)
+            self.assertFalse(np.ma.isMaskedArray(data[k]))
+            self.assertLessEqual(data[k].nbytes, ref[k].nbytes/2)
+            np.testing.assert_allclose(data[k], ref[k].filled(np.nan),
+                                       rtol=rtol)
+
+        orig = mmt.storedir
+        with tempfile.TemporaryDirectory() as tmpdir:
+            mmt.storedir = tmpdir
+            try:
+                mmt.build_store(quantities=['dBdt'], dtype=np.float32)
+                obs = mmt.load('dBdt', 1, 'OBS', 'ABK')
+            finally:
+                mmt.storedir = orig
+                mmt._store.clear()
+        for k in ('dbn', 'dbh'):
+            np.testing.assert_array_equal(obs[k], data[k])
+
+    def test_iter_ccmcfile(self):
+        '''Test that streamed blocks and window maxima match full reads'''
+
+        ref = mmt.read_ccmcfile(self.obs_file_dt)
+        blocks = list(mmt.iter_ccmcfile(self.obs_file_dt, chunk_rows=500))
+        self.assertEqual(len(blocks), int(np.ceil(ref['time'].size/500)))
+        self.assertTrue(all(b['time'].size <= 500 for b in blocks))
+
+        for k in ('time', 'dbn', 'dbh'):
+            whole = np.concatenate([b[k] for b in blocks])
+            self.assertEqual(whole[0], self.known_obs_dt[k][0])
+            self.assertEqual(whole[-1], self.known_obs_dt[k][-1])
+        np.testing.assert_array_equal(
+            np.concatenate([b['dbh'] for b in blocks]),
+            ref['dbh'].filled(np.nan))
+
+        # Window maxima do not depend on how the series is split up:
+        start, nwin = mmt._windows(mmt.tlims[1], 1200)
+        np.testing.assert_array_equal(
+            mmt.stream_window_max(reversed(blocks), start, 1200, nwin),
+            mmt.window_max(ref['time'], ref['dbh'], start, 1200, nwin))
+
+    def test_profile(self):
+        '''Test stage timers and counters'''
+
+        # Off by default:
+        mmt.profile_stats.clear()
+        mmt.read_ccmcfile(self.obs_file_dt)
+        self.assertEqual(mmt.profile_stats, {})
+
+        mmt.profile = True
+        mmt.clear_memo()
+        try:
+            table = mmt.build_table('2_LFM-MIX', event_set=[2],
+                                    mag_set='hi', verbose=False, jobs=1)
+        finally:
+            mmt.profile = False
+        stats = mmt.profile_stats
+
+        # Two files (obs and model) per station, one table per station:
+        nstat = table.obsmax.size // mmt._windows(mmt.tlims[2], 1200)[1]
+        self.assertEqual(stats['read']['memo_misses'], 2*nstat)
+        self.assertEqual(stats['bin']['calls'], 2*nstat)
+        self.assertEqual(stats['bin']['windows'], 2*table.obsmax.size)
+        self.assertEqual(stats['table']['tables'], nstat)
+        self.assertEqual(stats['merge']['merges'], nstat - 1)
+        self.assertTrue(all(x['seconds'] >= 0 for x in stats.values()))
+
+        out = io.StringIO()
+        mmt.profile_report(file=out)
+        self.assertIn('memo_misses=6', out.getvalue())
+        mmt.profile_stats.clear()
+
+    def test_import(self):
+        '''Test that importing the module is fast and pulls in no extras'''
+
+        budget = 0.5  # Seconds, including NumPy.
+
+        code = 'import sys, multimodtools; print(*sorted(sys.modules))'
+        result = subprocess.run([sys.executable, '-X', 'importtime', '-c',
+                                 code], capture_output=True, text=True,
+                                cwd=mmt.install_dir, check=True)
+
+        # Plotting, legacy, and process pool modules are loaded lazily:
+        loaded = result.stdout.split()
+        for mod in ('matplotlib', 'spacepy', 'validator', 'dateutil',
+                    'multiprocessing'):
+            self.assertNotIn(mod, loaded)
+
+        # Cumulative import time (microseconds) of multimodtools:
+        line = [x for x in result.stderr.splitlines()
+                if x.endswith('| multimodtools')][0]
+        self.assertLess(int(line.split('|')[1])/1e6, budget)
+
 
 # Define test case classes to group related tests together:
 class TestBinTable(unittest.TestCase):
@@ -139,6 +490,414 @@ class TestBinTable(unittest.TestCase):
         self.assertEqual(self.knownNanMod[0], self.t_nans.modmax[0])
         self.assertEqual(self.knownNanMod[-1], self.t_nans.modmax[-1])
 
+    def testWindowEdges(self):
+        '''Test that windows exclude data at or after their end'''
+
+        start = np.datetime64('2000-01-01T00:00:00')
+        time = start + np.arange(6) * np.timedelta64(30, 's')
+        maxes = mmt.window_max(time, [1., 2., 3., 4., 5., 6.], start, 60, 2)
+        np.testing.assert_array_equal(maxes, [2., 4.])
+
+    def testSweep(self):
+        '''Test that threshold sweeps match individual tables'''
+
+        binned = mmt.build_binned('2_LFM-MIX', event_set=[2], mag_set='hi')
+        sweep = mmt.contingency_sweep(binned, 0.3, [0.1, 0.3])
+
+        # Second model threshold is the reference table:
+        for x in ['hit', 'miss', 'falseP', 'trueN']:
+            self.assertEqual(self.knownLfmTable[x], sweep[x][1])
+        self.assertEqual(self.t_lfm.calc_heidke(), sweep['hss'][1])
+
+        # First matches a table built with a lower model threshold:
+        table = mmt.build_table('2_LFM-MIX', event_set=[2], mag_set='hi',
+                                modthresh=0.1)
+        for x in ['hit', 'miss', 'falseP', 'trueN']:
+            self.assertEqual(table[x], sweep[x][0])
+
+    def testCube(self):
+        '''Test that ensemble members match individual tables'''
+
+        cube = mmt.EnsembleCube(event_set=[2], mag_set='hi')
+        self.assertEqual(cube.modmax.shape, (5, self.t_lfm.obsmax.size))
+        self.assertTrue(cube.valid.all())
+
+        lfm = cube.table('2_LFM-MIX', 0.3)
+        for x in ['hit', 'miss', 'falseP', 'trueN']:
+            self.assertEqual(self.knownLfmTable[x], lfm[x])
+
+        # NPC member counts match the sum over individual tables:
+        count = np.zeros(cube.obsmax.size)
+        for m in cube.members:
+            count += mmt.build_table(m, event_set=[2], mag_set='hi',
+                                     verbose=False).bool
+        self.assertTrue((cube.count(0.3) == count).all())
+        self.assertTrue((cube.npc_table(0.3, n_models=2).bool ==
+                         (count >= 2)).all())
+
+    def testCubeDtype(self):
+        '''Test that a float32 cube gives the same tables as float64'''
+
+        cube = mmt.EnsembleCube(event_set=[2, 7], mag_set='all')
+        c32 = mmt.EnsembleCube(event_set=[2, 7], mag_set='all',
+                               dtype=np.float32)
+        self.assertEqual(c32.modmax.dtype, np.float32)
+        np.testing.assert_allclose(c32.modmax, cube.modmax, rtol=1e-6)
+
+        # Counts agree at the standard thresholds:
+        sweep, s32 = mmt.npc_sweep(cube), mmt.npc_sweep(c32)
+        for x in ['hit', 'miss', 'falseP', 'trueN']:
+            np.testing.assert_array_equal(sweep[x], s32[x])
+        table = c32.table('9_SWMF', 0.7)
+        for x in ['hit', 'miss', 'falseP', 'trueN']:
+            self.assertEqual(cube.table('9_SWMF', 0.7)[x], table[x])
+
+    def testJobs(self):
+        '''Test that parallel results are identical to serial ones'''
+
+        table = mmt.build_table('2_LFM-MIX', event_set=[2], mag_set='hi',
+                                verbose=False, jobs=2)
+        for x in ['hit', 'miss', 'falseP', 'trueN']:
+            self.assertEqual(self.knownLfmTable[x], table[x])
+        for x in ('obsmax', 'modmax', 'time'):
+            np.testing.assert_array_equal(getattr(self.t_lfm, x),
+                                          getattr(table, x))
+
+        serial = mmt.EnsembleCube(event_set=[2, 7], mag_set='all')
+        cube = mmt.EnsembleCube(event_set=[2, 7], mag_set='all', jobs=2)
+        for x in ('obsmax', 'modmax', 'valid', 'station'):
+            np.testing.assert_array_equal(getattr(serial, x),
+                                          getattr(cube, x))
+
+    def testNpcSweep(self):
+        '''Test NPC sweep rows against individual tables'''
+
+        cube = mmt.EnsembleCube(event_set=[2], mag_set='all')
+        sweep = mmt.npc_sweep(cube, threshes=[0.3, 0.7])
+        self.assertEqual(sweep.size, 2*len(cube.members)*3)
+
+        row = sweep[(sweep['thresh'] == 0.7) & (sweep['n_required'] == 2) &
+                    (sweep['group'] == 'hi')]
+        npc = mmt.EnsembleCube(event_set=[2], mag_set='hi').npc_table(0.7)
+        for x in ['hit', 'miss', 'falseP', 'trueN']:
+            self.assertEqual(npc[x], row[x][0])
+        self.assertAlmostEqual(npc.calc_heidke(), row['hss'][0])
+
+        det = cube.table('9_SWMF', 0.3)
+        row = sweep[(sweep['thresh'] == 0.3) & (sweep['group'] == 'all')]
+        self.assertTrue((row['det_pod'] == det.calc_HR()).all())
+        self.assertTrue((row['det_bias'] == det.calc_bias()).all())
+
+        # Reference OR NPC, from the table forecasts:
+        fcst = det.bool | (cube.npc_table(0.3, n_models=3).bool)
+        both = mmt.BinaryEventTable.from_maxima(cube.obsmax, 1*fcst, 0.3,
+                                                modelcutoff=1)
+        row = row[row['n_required'] == 3]
+        for x in ['hit', 'miss', 'falseP', 'trueN']:
+            self.assertEqual(both[x], row['or_' + x][0])
+        self.assertTrue((row['or_hit'] >= row['hit']).all())
+
+    def testConcatenate(self):
+        '''Test combining tables at once and dropping raw series'''
+
+        kwargs = {'event_set': [2], 'mag_set': 'hi', 'verbose': False}
+        lean = mmt.build_table('2_LFM-MIX', **kwargs)
+        full = mmt.build_table('2_LFM-MIX', keep_raw=True, **kwargs)
+        self.assertIsNone(lean.Obs)
+        self.assertFalse(hasattr(lean, '__dict__'))
+        for x in ['hit', 'miss', 'falseP', 'trueN']:
+            self.assertEqual(self.knownLfmTable[x], lean[x])
+            self.assertEqual(self.knownLfmTable[x], full[x])
+
+        # Same as adding tables one by one:
+        parts = [mmt.build_table('2_LFM-MIX', keep_raw=True, event_set=[2],
+                                 mag_set=[m], verbose=False)
+                 for m in mmt.hilat
+                 if m in mmt.get_catalog().stations(2, '2_LFM-MIX')]
+        total = parts[0] + parts[1]
+        for t in parts[2:]:
+            total += t
+        table = mmt.BinaryEventTable.concatenate(parts)
+        for x in ('time', 'obsmax', 'modmax', 'bool', 'tObs', 'Obs', 'Mod'):
+            np.testing.assert_array_equal(getattr(table, x),
+                                          getattr(total, x))
+            np.testing.assert_array_equal(getattr(table, x),
+                                          getattr(full, x))
+        np.testing.assert_array_equal(lean.obsmax, full.obsmax)
+        self.assertIsNone((parts[0] + lean).Obs)
+
+        with self.assertRaises(ValueError):
+            mmt.BinaryEventTable.concatenate(
+                [lean, mmt.build_table('2_LFM-MIX', thresh=0.7, **kwargs)])
+
+    def testBreakdown(self):
+        '''Test mag groups and leave-one-out from per-station counts'''
+
+        keys = ('hit', 'miss', 'falseP', 'trueN')
+        cube = mmt.EnsembleCube(event_set=[2, 3], mag_set='all')
+
+        # Selecting from one cube matches building each group directly:
+        for group in ('hi', 'lo', ['YKC', 'ott']):
+            sub = cube.select(mag_set=group)
+            ref = mmt.EnsembleCube(event_set=[2, 3], mag_set=group)
+            for a, b in ((sub.npc_table(0.3), ref.npc_table(0.3)),
+                         (sub.table('2_LFM-MIX', 0.7),
+                          ref.table('2_LFM-MIX', 0.7))):
+                self.assertEqual([a[k] for k in keys], [b[k] for k in keys])
+        self.assertEqual(mmt.union_mags(['hi', 'lo']), sorted(mmt.allmag))
+
+        # Per-station counts add up to any group:
+        for model in (None, '2_LFM-MIX'):
+            rows = cube.breakdown(0.3, model=model)
+            sub = cube.select(event_set=3, mag_set='hi')
+            table = sub.npc_table(0.3) if model is None \
+                else sub.table(model, 0.3)
+            loc = (rows['event'] == 3) & np.isin(rows['station'], mmt.hilat)
+            for k in keys:
+                self.assertEqual(rows[k][loc].sum(), table[k])
+
+        # Leaving one station out is a subtraction:
+        rows = cube.breakdown(0.3, n_models=3)
+        rest = [m for m in mmt.allmag if m != 'YKC']
+        table = mmt.EnsembleCube(event_set=[2, 3], mag_set=rest).npc_table(
+            0.3, n_models=3)
+        for k in keys:
+            self.assertEqual(rows[k].sum() - rows[k][rows['station'] ==
+                                                     'YKC'].sum(), table[k])
+
+    def testStride(self):
+        '''Test overlapping windows against a window-by-window search'''
+
+        start = np.datetime64('2000-01-01T00:00:00')
+        time = start + np.sort(np.random.default_rng(2).integers(
+            0, 6*3600, 500)).astype('timedelta64[s]')
+        values = np.random.default_rng(3).random(500)
+        values[100:200] = np.nan
+        for window, stride, nwin in ((1200, 60, 340), (600, 900, 24),
+                                     (1200, 1200, 18)):
+            slow = [mmt.window_max(time, values, start + np.timedelta64(
+                i*stride, 's'), window, 1)[0] for i in range(nwin)]
+            np.testing.assert_array_equal(
+                mmt.window_max(time, values, start, window, nwin, stride),
+                slow)
+
+        # Overlapping windows feed tables, sweeps, and the NPC alike:
+        kwargs = {'event_set': [2], 'mag_set': 'hi'}
+        table = mmt.build_table('2_LFM-MIX', stride=1, verbose=False,
+                                **kwargs)
+        self.assertEqual(table.obsmax.size, 20 * self.t_lfm.obsmax.size)
+        sweep = mmt.contingency_sweep(
+            mmt.build_binned('2_LFM-MIX', stride=1, **kwargs), 0.3)
+        cube = mmt.EnsembleCube(stride=1, **kwargs)
+        for x in ['hit', 'miss', 'falseP', 'trueN']:
+            self.assertEqual(sweep[x], table[x])
+            self.assertEqual(cube.table('2_LFM-MIX', 0.3)[x], table[x])
+        self.assertGreater(cube.npc_table(0.3)['hit'], 0)
+        with self.assertRaises(ValueError):
+            mmt.BinaryEventTable.concatenate([table, self.t_lfm])
+
+    def testOptimize(self):
+        '''Test exact model threshold curves and optima against a sweep'''
+
+        binned = mmt.build_binned('2_LFM-MIX', event_set=[2], mag_set='hi')
+        curve = mmt.threshold_curve(binned, 0.3)
+        self.assertTrue(np.all(np.diff(curve['modthresh']) < 0))
+
+        # Exact at, and constant just above, every breakpoint:
+        for threshes, part in ((curve['modthresh'], slice(None)),
+                               (np.nextafter(curve['modthresh'][1:], np.inf),
+                                slice(-1))):
+            sweep = mmt.contingency_sweep(binned, 0.3, threshes)
+            for x in ['hit', 'miss', 'falseP', 'trueN', 'hss', 'bias']:
+                np.testing.assert_array_equal(sweep[x], curve[x][part])
+
+        # No threshold on a fine grid beats the optimum:
+        scores = {'hss': lambda c: c['hss'],
+                  'bias': lambda c: -np.abs(1 - c['bias']),
+                  'pss': lambda c: c['pod'] - c['pofd']}
+        grid = mmt.contingency_sweep(binned, 0.3, np.linspace(0, 1, 1001))
+        for metric, score in scores.items():
+            best = mmt.optimize_threshold(binned, 0.3, metric)
+            self.assertGreater(best['modthresh'], best['lower'])
+            self.assertLessEqual(np.nanmax(score(grid)), score(best))
+            table = mmt.build_table('2_LFM-MIX', event_set=[2], mag_set='hi',
+                                    modthresh=best['modthresh'],
+                                    verbose=False)
+            for x in ['hit', 'miss', 'falseP', 'trueN']:
+                self.assertEqual(best[x], table[x])
+        with self.assertRaises(ValueError):
+            mmt.optimize_threshold(binned, 0.3, 'pofd')
+
+    def testWindowSweep(self):
+        '''Test that window lengths from the max pyramid match rebinning'''
+
+        kwargs = {'event_set': [2], 'mag_set': 'hi'}
+        sweep = mmt.window_sweep('2_LFM-MIX', windows=[5, 7, 20, 60],
+                                 **kwargs)
+        for i, window in enumerate(sweep['window']):
+            table = mmt.build_table('2_LFM-MIX', window=int(window),
+                                    verbose=False, **kwargs)
+            for x in ['hit', 'miss', 'falseP', 'trueN']:
+                self.assertEqual(sweep[x][i], table[x])
+            self.assertAlmostEqual(sweep['hss'][i], table.calc_heidke())
+
+        # Any multiple of the base bins, up to the whole series:
+        start = np.datetime64('2000-01-01T00:00:00')
+        time = start + np.arange(1200) * np.timedelta64(30, 's')
+        values = np.random.default_rng(1).random(1200)
+        values[100:400] = np.nan
+        pyramid = mmt.MaxPyramid(mmt.window_max(time, values, start, 60, 600))
+        for window, nwin in ((60, 600), (180, 200), (1380, 4), (36000, 1)):
+            np.testing.assert_array_equal(
+                pyramid.maxima(window, nwin),
+                mmt.window_max(time, values, start, window, nwin))
+        for window, nwin in ((90, 2), (1200, 31)):
+            with self.assertRaises(ValueError):
+                pyramid.maxima(window, nwin)
+
+    def testResults(self):
+        '''Test storing metrics and reusing them for NPC sweeps'''
+
+        cube = mmt.EnsembleCube(event_set=[2], mag_set='all')
+        kwargs = {'event_set': [2], 'threshes': [0.3, 0.7],
+                  'n_required': [1, 2]}
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            store = mmt.ResultsStore(os.path.join(tmpdir, 'results.sqlite'))
+
+            # Keys are normalized; adding again replaces the row:
+            det = cube.table('9_SWMF', 0.3)
+            store.add(det, '9_SWMF', events=2, mags='low')
+            store.add(det, '9_SWMF', events=[2], mags='lo')
+            self.assertEqual(len(store), 1)
+            row = store.get('9_SWMF', events=2, mags=mmt.lolat)
+            self.assertEqual(row['hit'], det['hit'])
+            self.assertEqual(row['hss'], det.calc_heidke())
+            self.assertIsNone(store.get('9_SWMF', events=2, thresh=0.7))
+
+            # A model threshold equal to the observed one is the default:
+            store.add(det, '9_SWMF', events=2, mags='lo', modthresh=0.3)
+            store.add(det, '9_SWMF', events=2, mags='hi',
+                      modthresh=[0.3, 0.3])
+            self.assertEqual(len(store), 2)
+            self.assertEqual(store.get('9_SWMF', events=2, mags='hi',
+                                       modthresh=None)['hit'], det['hit'])
+            self.assertIsNone(store.get('9_SWMF', events=2, mags='hi',
+                                        modthresh=0.2))
+
+            # Overlapping windows are kept apart from the default ones:
+            strided = mmt.EnsembleCube(event_set=[2], mag_set='lo',
+                                       stride=10).table('9_SWMF', 0.3)
+            store.add(strided, '9_SWMF', events=2, mags='lo')
+            self.assertEqual(len(store), 3)
+            self.assertEqual(store.get('9_SWMF', events=2, mags='lo',
+                                       stride=20)['hit'], det['hit'])
+            self.assertEqual(store.get('9_SWMF', events=2, mags='lo',
+                                       stride=10)['hit'], strided['hit'])
+            store.clear()
+
+            # Stores without the stride key are migrated:
+            old = os.path.join(tmpdir, 'old.sqlite')
+            with contextlib.closing(sqlite3.connect(old)) as con, con:
+                con.execute('CREATE TABLE metrics (forecast TEXT, ' +
+                            'events TEXT, mags TEXT, thresh REAL, ' +
+                            'modthresh TEXT, n_required INTEGER, ' +
+                            'window INTEGER, hit INTEGER, miss INTEGER, ' +
+                            'falseP INTEGER, trueN INTEGER, pod REAL, ' +
+                            'pofd REAL, hss REAL, bias REAL)')
+                con.execute("INSERT INTO metrics VALUES ('9_SWMF', '2', " +
+                            "'lo', 0.3, '', 0, 20, 1, 2, 3, 4, " +
+                            "0.33, 0.43, 0.0, 1.33)")
+            migrated = mmt.ResultsStore(old)
+            self.assertEqual(migrated.query()['stride'].tolist(), [20])
+            self.assertEqual(migrated.get('9_SWMF', events=2,
+                                          mags='lo')['hit'], 1)
+            migrated.close()
+
+            # Computed on the first call, then only read back:
+            sweep = mmt.npc_results(store=store, **kwargs)
+            self.assertEqual(len(store), 2*2*3*2 + 2*3)
+            orig = mmt.EnsembleCube
+            mmt.EnsembleCube = None
+            try:
+                again = mmt.npc_results(store=store, **kwargs)
+            finally:
+                mmt.EnsembleCube = orig
+            ref = mmt.npc_sweep(cube, [0.3, 0.7], [1, 2])
+            for x in ref.dtype.names:
+                np.testing.assert_array_equal(sweep[x], ref[x])
+                np.testing.assert_array_equal(again[x], ref[x])
+
+            # Only the missing threshold is added:
+            mmt.npc_results(store=store, **dict(kwargs, threshes=[0.3, 1.1]))
+            self.assertEqual(len(store), 3*2*3*2 + 3*3)
+            self.assertEqual(store.query(thresh=1.1, mags='hi').size, 5)
+            store.close()
+
+    def testIncremental(self):
+        '''Test that live evaluation matches the ensemble cube'''
+
+        start, end = [np.datetime64(t, 's') for t in mmt.tlims[2]]
+        cube = mmt.EnsembleCube(event_set=[2], mag_set='hi')
+        cat = mmt.get_catalog()
+
+        # Interleave all samples in time order, as they would arrive:
+        feed = []
+        for stn in np.unique(cube.station):
+            for src in ['OBS'] + cube.members:
+                data = mmt.read_ccmcfile(cat.get('dBdt', 2, src, stn))
+                time = data['time'].astype('datetime64[s]')
+                feed += [(t, stn, src, v) for t, v in
+                         zip(time, data['dbh'].filled(np.nan)) if t < end]
+        feed.sort(key=lambda x: x[0])
+
+        # Checkpoint and resume halfway through:
+        live = mmt.IncrementalEnsemble(start)
+        closed = []
+        with tempfile.TemporaryDirectory() as tmpdir:
+            for i, sample in enumerate(feed):
+                closed += live.push(*sample)
+                if i == len(feed)//2:
+                    live.save(os.path.join(tmpdir, 'live.json'))
+                    live = mmt.IncrementalEnsemble.resume(
+                        os.path.join(tmpdir, 'live.json'))
+        closed += live.close(end)
+
+        self.assertEqual(len(closed), cube.obsmax.size)
+        self.assertEqual(live.n_late, 0)
+        npc = cube.npc_table(0.3)
+        for name in ['npc'] + cube.members:
+            table = npc if name == 'npc' else cube.table(name, 0.3)
+            for x in ['hit', 'miss', 'falseP', 'trueN']:
+                self.assertEqual(table[x], live.counts[name][x])
+        self.assertAlmostEqual(live.metrics()['hss'], npc.calc_heidke())
+
+    def testIncrementalSilent(self):
+        '''Test that a silent member does not hold up live forecasts'''
+
+        start = np.datetime64('2006-12-14T00:00:00')
+        live = mmt.IncrementalEnsemble(start, members=['A', 'B', 'C'])
+        closed = []
+        for minute in range(6*24*60):
+            t = start + np.timedelta64(minute, 'm')
+            for src in ['OBS', 'A', 'B']:
+                closed += live.push(t, 'abc', src, 1.0)
+
+        # All but the current and max_lag windows are closed:
+        self.assertEqual(len(closed), 6*24*3 - 2)
+        self.assertEqual(len(live._open['ABC']), 2)
+        self.assertTrue(all(win['forecast'] for win in closed))
+        self.assertTrue(all(np.isnan(win['modmax'][2]) for win in closed))
+
+        # Late data for a closed window is dropped:
+        live.push(start, 'ABC', 'C', 1.0)
+        self.assertEqual(live.n_late, 1)
+
+        closed += live.close()
+        self.assertEqual(len(closed), 6*24*3)
+        self.assertEqual(live.counts['npc']['hit'], 6*24*3)
+        self.assertEqual(live.counts['C']['miss'], 6*24*3)
+
 
 # Run all tests:
 if __name__ == '__main__':